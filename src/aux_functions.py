@@ -17,13 +17,15 @@ class AuxFunClass:
             fl.append(item.rstrip('\n'))
         return fl
 
-    def querysplitter(self,query,abb_refrence):
+    # query_proc: rmovepu(query), computed once per sentence by the callers
+    # that split the same sentence for several patterns
+    def querysplitter(self, query, abb_refrence, query_proc=None):
         lssplits = []
 
-        query_proc = self.rmovepu(self, query)
+        if query_proc is None:
+            query_proc = self.rmovepu(self, query)
         listofindexs = [m.start() for m in re.finditer(abb_refrence,
                                                        query_proc)]
-        lentofindex = len(listofindexs)
 
         for i in listofindexs:
             left_words = nltk.word_tokenize(query_proc[:i])
@@ -39,14 +41,13 @@ class AuxFunClass:
                 context = context + right_words[:6]
             else:
                 context = context + right_words
-            #print(len(context))
             lssplits.append(' '.join(context))
 
         return lssplits
 
     # find that the seperation of features and extracted words are same
     def sepfinder(self, abb, ls):
-        punc = lsarray1.Punctuation + lsarray1.Punctuation1 + lsarray1.Punctuation2 + ["I"] + [" "]
+        punc = lsarray1.SepFinderBoundary
         list1 = []
         list2 = []
         for item1 in abb:
@@ -71,8 +72,7 @@ class AuxFunClass:
         return list1, list2
 
     def rmovepu(self,item):
-        puli = lsarray1.Punctuation2 + lsarray1.Punctuation1 + lsarray1.Punctuation + ['(', ')']
-        puli = list(set(puli))
+        puli = lsarray1.RmovePunctuation
         # puli.remove(')')
         fil_words = [word for word in nltk.word_tokenize(item)
                      if word not in puli]
@@ -0,0 +1,420 @@
+import argparse
+import json
+import platform
+import random
+import statistics
+import time
+
+import numpy as np
+
+import benchmark_reference as reference
+import einb
+from aux_functions import AuxFunClass as auxfun
+from rclc_conf import RAND_SEED
+from sentence_filtering import (
+    SentenceFilterClass, load_matcher, _hit_sentences, _pattern_hits,
+    RESOURCE_PATH, ABBS_PATH, PHRS_PATH)
+from text_utils import punkt_tokenizer
+
+DATASET_TEXT_PATH = RESOURCE_PATH + 'dataset_text_dict.json'
+PAGE_CHARS = 3000  # characters of a synthetic page
+SENTENCE_WORDS = (12, 30)  # words per synthetic sentence
+
+BENCHMARKS = ['candidates', 'sepfinder', 'querysplitter', 'final_approach',
+              'parameter_learn', 'predict']
+
+
+class Vocabulary:
+    """ Realistic vocabularies shipped with the repo: the filter patterns,
+        the dataset descriptions, and filler words (words of the dataset
+        descriptions that match no pattern).
+    """
+
+    def __init__(self):
+        self.matcher = load_matcher(ABBS_PATH, PHRS_PATH)
+        self.patterns = sorted(set(p for p in self.matcher.patterns if p))
+        with open(DATASET_TEXT_PATH, 'r', encoding='utf-8') as f:
+            self.dataset_texts = json.load(f)
+        self.datasets = list(self.dataset_texts.keys())
+        words = set()
+        for text in self.dataset_texts.values():
+            words.update(text.split())
+        self.filler = sorted(w for w in words
+                             if w.isalpha() and not self.matcher.matches(w))
+
+
+def make_sentence(rng, vocab, density):
+    words = [rng.choice(vocab.filler)
+             for _ in range(rng.randint(*SENTENCE_WORDS))]
+    if rng.random() < density:
+        words.insert(rng.randrange(len(words)), rng.choice(vocab.patterns))
+    return ' '.join(words) + '.'
+
+
+def make_document(rng, vocab, pages, density):
+    """ Synthetic publication text of about `pages` pages, in which a
+        fraction `density` of the sentences mention a pattern.
+    """
+    sentences = []
+    size = 0
+    while size < pages * PAGE_CHARS:
+        sentences.append(make_sentence(rng, vocab, density))
+        size += len(sentences[-1]) + 1
+    return ' '.join(sentences)
+
+
+def make_training_set(rng, vocab, n_pubs, n_datasets, words=60):
+    """ Synthetic (filtered sentences, labels) pairs: every publication
+        cites 1 to 3 of the first `n_datasets` datasets, its text mixes
+        words of their descriptions with filler words.
+    """
+    datasets = vocab.datasets[:n_datasets]
+    contexts = []
+    labels = []
+    for _ in range(n_pubs):
+        cited = rng.sample(datasets, rng.randint(1, min(3, len(datasets))))
+        text = []
+        for dataset in cited:
+            description = vocab.dataset_texts[dataset].split()
+            text.extend(rng.choice(description)
+                        for _ in range(words // (2 * len(cited))))
+        text.extend(rng.choice(vocab.filler) for _ in range(words // 2))
+        rng.shuffle(text)
+        contexts.append(' '.join(text))
+        labels.append(cited)
+    return contexts, labels
+
+
+def _time(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times), statistics.median(times)
+
+
+def _result(benchmark, impl, params, fn, items, unit, repeat,
+            reference=None, same=None):
+    """ time `fn`; with a `reference` result (an earlier _result, of the
+        original implementation), also check that `fn` gives the same
+        output (compared by `same`, default ==) and record the speedup
+    """
+    best, median = _time(fn, repeat)
+    result = {'benchmark': benchmark, 'impl': impl, 'params': params,
+              'seconds': best, 'median_seconds': median,
+              'throughput': items / best if best else None, 'unit': unit}
+    note = ''
+    if reference is not None:
+        same = same or (lambda a, b: a == b)
+        result['matches_reference'] = bool(same(fn(), reference['output']))
+        result['speedup'] = reference['seconds'] / best if best else None
+        note = f' x{result["speedup"]:.2f} ' + \
+            ('same output' if result['matches_reference'] else
+             'DIFFERENT OUTPUT')
+    print(f'{benchmark:>16} {impl:>22} {json.dumps(params):<40} '
+          f'{result["throughput"]:12.1f} {unit}{note}')
+    return result
+
+
+def _reference(benchmark, params, fn, items, unit, repeat):
+    # the original implementation; its output is kept for the comparisons
+    # and dropped from the report
+    result = _result(benchmark, 'reference', params, fn, items, unit, repeat)
+    result['output'] = fn()
+    return result
+
+
+def _drop_outputs(results):
+    for result in results:
+        result.pop('output', None)
+    return results
+
+
+def _same_set(a, b):
+    return set(a) == set(b)
+
+
+def bench_candidates(vocab, args):
+    """ candidate patterns of a document: one sep_checK call per pattern
+        (reference) against the PatternMatcher scan
+    """
+    ref_filter = reference.SentenceFilterClass()
+    results = []
+    for pages in args.pages:
+        rng = random.Random(RAND_SEED)
+        text = make_document(rng, vocab, pages, args.density)
+        params = {'pages': pages, 'density': args.density}
+        ref = _reference(
+            'candidates', params,
+            lambda: [p for p in vocab.matcher.patterns
+                     if ref_filter.sep_checK(p, text)],
+            pages, 'pages/s', args.repeat)
+        results.append(ref)
+        results.append(_result(
+            'candidates', 'pattern_matcher', params,
+            lambda: vocab.matcher.candidates(text),
+            pages, 'pages/s', args.repeat, ref))
+    return _drop_outputs(results)
+
+
+def bench_sepfinder(vocab, args):
+    results = []
+    for pages in args.pages:
+        rng = random.Random(RAND_SEED)
+        text = make_document(rng, vocab, pages, args.density)
+        sentences = punkt_tokenizer().tokenize(text)
+        candidates = vocab.matcher.candidates(text)
+        params = {'pages': pages, 'density': args.density,
+                  'candidates': len(candidates)}
+        ref = _reference(
+            'sepfinder', params,
+            lambda: reference.auxfun.sepfinder(reference.auxfun, candidates,
+                                               sentences),
+            pages, 'pages/s', args.repeat)
+        results.append(ref)
+        results.append(_result(
+            'sepfinder', 'sepfinder', params,
+            lambda: auxfun.sepfinder(auxfun, candidates, sentences),
+            pages, 'pages/s', args.repeat, ref))
+    return _drop_outputs(results)
+
+
+def bench_querysplitter(vocab, args):
+    rng = random.Random(RAND_SEED)
+    pairs = []
+    for _ in range(args.queries):
+        pattern = rng.choice(vocab.patterns)
+        words = [rng.choice(vocab.filler)
+                 for _ in range(rng.randint(*SENTENCE_WORDS))]
+        words.insert(rng.randrange(len(words)), pattern)
+        pairs.append((' '.join(words) + '.', pattern))
+    params = {'sentences': len(pairs)}
+
+    ref = _reference(
+        'querysplitter', params,
+        lambda: [reference.auxfun.querysplitter(reference.auxfun, sentence,
+                                                pattern)
+                 for sentence, pattern in pairs],
+        len(pairs), 'sentences/s', args.repeat)
+    return _drop_outputs([ref, _result(
+        'querysplitter', 'querysplitter', params,
+        lambda: [auxfun.querysplitter(auxfun, sentence, pattern)
+                 for sentence, pattern in pairs],
+        len(pairs), 'sentences/s', args.repeat, ref)])
+
+
+def bench_final_approach(vocab, args):
+    """ whole filtering of a document, scaling with its length and with the
+        density of pattern mentions (original implementation as reference,
+        whole text tokenized, sentences around the pattern hits only); the
+        share of the sentences tokenized by the latter is reported as
+        tokenized_fraction
+    """
+    ref_filter = reference.SentenceFilterClass()
+    sent_filter = SentenceFilterClass()
+    results = []
+    for density in args.densities:
+        for pages in args.pages:
+            rng = random.Random(RAND_SEED)
+            text = make_document(rng, vocab, pages, density)
+            params = {'pages': pages, 'density': density}
+            ref = _reference(
+                'final_approach', params,
+                lambda: ref_filter.final_approach(text, ABBS_PATH, PHRS_PATH),
+                pages, 'pages/s', args.repeat)
+            results.append(ref)
+            results.append(_result(
+                'final_approach', 'candidate_windows', params,
+                lambda: sent_filter.candidate_windows(
+                    text, vocab.matcher.candidates(text)),
+                pages, 'pages/s', args.repeat, ref, _same_set))
+            results.append(_result(
+                'final_approach', 'final_approach', params,
+                lambda: sent_filter.final_approach(text),
+                pages, 'pages/s', args.repeat, ref, _same_set))
+            _, tokenized = _hit_sentences(
+                text, _pattern_hits(text, vocab.matcher.candidates(text)))
+            results[-1]['tokenized_fraction'] = \
+                tokenized / len(punkt_tokenizer().tokenize(text))
+    return _drop_outputs(results)
+
+
+def _word_counts(tables):
+    # (dataset, word) -> count of parameter_learn tables
+    dataset_word_dict, _ = tables
+    return {(d, w): c for d, words in dataset_word_dict.items()
+            for w, c in words.items() if c and w not in ('U_COUNT', 'COUNT')}
+
+
+def _model_counts(model):
+    counts = model.counts.tocoo()
+    return {(model.datasets[d], model.words[w]): int(c)
+            for d, w, c in zip(counts.row, counts.col, counts.data)}
+
+
+def bench_parameter_learn(vocab, args):
+    rng = random.Random(RAND_SEED)
+    contexts, labels = make_training_set(rng, vocab, args.pubs,
+                                         len(vocab.datasets))
+    params = {'pubs': args.pubs}
+    ref = _reference('parameter_learn', params,
+                     lambda: reference.parameter_learn(contexts, labels),
+                     args.pubs, 'pubs/s', args.repeat)
+    ref['output'] = _word_counts(ref['output'])
+    learners = [
+        ('parameter_learn', einb.parameter_learn, _word_counts),
+        ('count_learn', einb.count_learn,
+         lambda counts: _word_counts(counts.to_tables())),
+        ('sparse_parameter_learn', einb.sparse_parameter_learn,
+         _model_counts),
+    ]
+    return _drop_outputs([ref] + [
+        _result('parameter_learn', name, params,
+                lambda: learn(contexts, labels), args.pubs, 'pubs/s',
+                args.repeat, ref, lambda output, ref_output, word_counts=\
+                word_counts: word_counts(output) == ref_output)
+        for name, learn, word_counts in learners])
+
+
+def _same_predictions(preds, ref_preds):
+    return len(preds) == len(ref_preds) and all(
+        [d for d, _ in p] == [d for d, _ in r] and
+        np.allclose([s for _, s in p], [s for _, s in r])
+        for p, r in zip(preds, ref_preds))
+
+
+def bench_predict(vocab, args):
+    """ prediction throughput, scaling with the number of datasets in the
+        model (original dict predict as reference, dict tables with an
+        inverted index, sparse model one query at a time and in batch)
+    """
+    results = []
+    for n_datasets in args.datasets:
+        n_datasets = min(n_datasets, len(vocab.datasets))
+        rng = random.Random(RAND_SEED)
+        contexts, labels = make_training_set(
+            rng, vocab, max(args.pubs, n_datasets), n_datasets)
+        queries, _ = make_training_set(rng, vocab, args.queries, n_datasets)
+        # the reference predict adds entries to its tables
+        ref_tables = reference.parameter_learn(contexts, labels)
+        dataset_word_dict, word_dataset_dict = \
+            einb.parameter_learn(contexts, labels)
+        model = einb.sparse_parameter_learn(contexts, labels)
+        params = {'datasets': n_datasets, 'queries': len(queries)}
+
+        ref = _reference(
+            'predict', params,
+            lambda: [reference.predict(query, *ref_tables, 5)
+                     for query in queries],
+            len(queries), 'predictions/s', args.repeat)
+        results.append(ref)
+        results.append(_result(
+            'predict', 'predict', params,
+            lambda: [einb.predict(query, dataset_word_dict,
+                                  word_dataset_dict, 5)
+                     for query in queries],
+            len(queries), 'predictions/s', args.repeat, ref,
+            _same_predictions))
+        results.append(_result(
+            'predict', 'sparse_predict', params,
+            lambda: [einb.sparse_predict(query, model, 5)
+                     for query in queries],
+            len(queries), 'predictions/s', args.repeat, ref,
+            _same_predictions))
+        results.append(_result(
+            'predict', 'predict_batch', params,
+            lambda: einb.predict_batch(queries, model, 5),
+            len(queries), 'predictions/s', args.repeat, ref,
+            _same_predictions))
+    return _drop_outputs(results)
+
+
+def _key(result):
+    return (result['benchmark'], result['impl'],
+            json.dumps(result['params'], sort_keys=True))
+
+
+def compare(results, reference_file):
+    """ print the speedup of every result over the same benchmark in a
+        previous run
+    """
+    with open(reference_file, 'r') as f:
+        reference = {_key(r): r for r in json.load(f)['results']}
+    for result in results:
+        previous = reference.get(_key(result))
+        if previous and result['seconds']:
+            print(f'{result["benchmark"]:>16} {result["impl"]:>22} '
+                  f'{json.dumps(result["params"]):<40} '
+                  f'x{previous["seconds"] / result["seconds"]:.2f}')
+
+
+def main(args):
+    vocab = Vocabulary()
+    functions = {
+        'candidates': bench_candidates,
+        'sepfinder': bench_sepfinder,
+        'querysplitter': bench_querysplitter,
+        'final_approach': bench_final_approach,
+        'parameter_learn': bench_parameter_learn,
+        'predict': bench_predict,
+    }
+    results = []
+    for name in args.benchmarks:
+        results.extend(functions[name](vocab, args))
+
+    report = {
+        'seed': RAND_SEED,
+        'host': {'platform': platform.platform(),
+                 'python': platform.python_version()},
+        'args': vars(args),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+    different = [r for r in results if r.get('matches_reference') is False]
+    if different:
+        raise SystemExit('output differs from the reference: ' + ', '.join(
+            f'{r["benchmark"]}/{r["impl"]}' for r in different))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark sentence \
+                                     filtering and einb on synthetic \
+                                     publications')
+    parser.add_argument('--benchmarks', type=str, nargs='+',
+                        default=BENCHMARKS, choices=BENCHMARKS,
+                        help='Benchmarks to run (default: all)')
+    parser.add_argument('--pages', type=int, nargs='+',
+                        default=[1, 4, 16],
+                        help='Document lengths, in pages of '
+                        f'{PAGE_CHARS} characters')
+    parser.add_argument('--density', type=float,
+                        default=0.05,
+                        help='Fraction of sentences mentioning a pattern')
+    parser.add_argument('--densities', type=float, nargs='+',
+                        default=[0.01, 0.05, 0.2],
+                        help='Densities of the final_approach benchmark')
+    parser.add_argument('--datasets', type=int, nargs='+',
+                        default=[100, 1000, 10000],
+                        help='Numbers of datasets of the predict benchmark')
+    parser.add_argument('--pubs', type=int,
+                        default=2000,
+                        help='Training publications')
+    parser.add_argument('--queries', type=int,
+                        default=200,
+                        help='Sentences / predictions per measure')
+    parser.add_argument('--repeat', type=int,
+                        default=3,
+                        help='Measures per benchmark (the best is kept)')
+    parser.add_argument('--output', type=str,
+                        default=None,
+                        help='Json file receiving the results')
+    parser.add_argument('--compare', type=str,
+                        default=None,
+                        help='Results of a previous run to compare with')
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,202 @@
+# Frozen copies of the implementations of the original baseline, used by
+# benchmark.py as the reference for speed and output. Keep them as they
+# are: they are not meant to follow the changes of the modules they come
+# from.
+import re
+import nltk
+import numpy as np
+import lsarray1
+from collections import defaultdict
+from nltk.tokenize import sent_tokenize
+
+RESOURCE_PATH = '../resources/'
+ABBS_PATH = RESOURCE_PATH + 'listofabb_dataset.txt'
+PHRS_PATH = RESOURCE_PATH + 'listofPhrase_dataset.txt'
+
+
+class AuxFunClass:
+
+    def __init__(self):
+        pass
+
+    def readtoarr2(self, str):
+        with open(str, "r", encoding="utf-8") as f:
+            mylist = list(f)
+        fl = []
+        for item in mylist:
+            fl.append(item.rstrip('\n'))
+        return fl
+
+    def querysplitter(self,query,abb_refrence):
+        lssplits = []
+
+        query_proc = self.rmovepu(self, query)
+        listofindexs = [m.start() for m in re.finditer(abb_refrence,
+                                                       query_proc)]
+        lentofindex = len(listofindexs)
+
+        for i in listofindexs:
+            left_words = nltk.word_tokenize(query_proc[:i])
+            right_words = nltk.word_tokenize(query_proc[i:])
+
+            context = []
+            if len(left_words) >= 5:
+                context = context + left_words[-5:]
+            else:
+                context = context + left_words
+
+            if len(right_words) >= 6:
+                context = context + right_words[:6]
+            else:
+                context = context + right_words
+            #print(len(context))
+            lssplits.append(' '.join(context))
+
+        return lssplits
+
+    # find that the seperation of features and extracted words are same
+    def sepfinder(self, abb, ls):
+        punc = lsarray1.Punctuation + lsarray1.Punctuation1 + lsarray1.Punctuation2 + ["I"] + [" "]
+        list1 = []
+        list2 = []
+        for item1 in abb:
+            for item in ls:
+                if item1 in item:
+                    index = item.find(item1)
+                    lent = len(item1)
+                    if item[index + lent:index + lent + 1] in punc or item[index + lent:index + lent + 1].isdigit():
+                        if item.find(item1) == 0:
+                            list1.append(item)
+                            list2.append(item1)
+                        elif item[index - 1:index] in punc:
+                            list1.append(item)
+                            list2.append(item1)
+                    elif index + lent == len(item):
+                        if item.find(item1) == 0:
+                            list1.append(item)
+                            list2.append(item1)
+                        elif item[index - 1:index] in punc:
+                            list1.append(item)
+                            list2.append(item1)
+        return list1, list2
+
+    def rmovepu(self,item):
+        puli = lsarray1.Punctuation2 + lsarray1.Punctuation1 + lsarray1.Punctuation + ['(', ')']
+        puli = list(set(puli))
+        # puli.remove(')')
+        fil_words = [word for word in nltk.word_tokenize(item)
+                     if word not in puli]
+        return ' '.join(fil_words)
+
+
+auxfun = AuxFunClass
+
+
+class SentenceFilterClass:
+
+
+    # This function checks if a special feature exists in a context.
+    def sep_checK(self,abb,cont):
+            punc= lsarray1.Punctuation + lsarray1.Punctuation1 + lsarray1.Punctuation2 + [' '] + ['s']
+            while abb in cont:
+                    index=cont.find(abb)
+                    lent=len(abb)
+                    if cont[index+lent:index+lent+1] in punc or cont[index+lent:index+lent+1].isdigit():
+                        if cont.find(abb)==0:
+                            return True
+                        elif cont[index-1:index] in punc or cont[index-1:index]==' ':
+                            return True
+                    elif index+lent==len(cont):
+                        if cont.find(abb)==0:
+                            return True
+                        elif cont[index-1:index] in punc:
+                            return True
+
+                    try:
+                        cont=cont[index+1:]
+                    except:
+                        return False
+            return False
+
+    def final_approach(self, context, ABBS_PATH = ABBS_PATH, PHRS_PATH = PHRS_PATH):
+        ls = sent_tokenize(context)
+
+        abb1= auxfun.readtoarr2(auxfun,ABBS_PATH)
+        abb2= auxfun.readtoarr2(auxfun, PHRS_PATH)
+
+        candidate=[]
+        for item in abb1:
+            if self.sep_checK(item,context):
+                candidate.append(item)
+        for item in abb2:
+            if self.sep_checK(item,context):
+                candidate.append(item)
+
+        #find whether there are exact macthes
+        #return sentencesa and features
+        textlist,abbinTlist= auxfun.sepfinder(auxfun, candidate, ls)
+
+        abbinTlist1=list(set(abbinTlist))
+        textlist1=list(set(textlist))
+
+        lsallsplit=[]
+        for itemabb_q in abbinTlist1:
+           for itemsenasquery in textlist1:
+                if self.sep_checK(itemabb_q,itemsenasquery):
+                    neulistofquery= auxfun.querysplitter(auxfun, itemsenasquery, itemabb_q)
+                    lsallsplit=lsallsplit+neulistofquery
+        textlist1=list(set(lsallsplit))
+
+        return textlist1
+
+
+def parameter_learn(filtered_sentences, labels):
+    """
+    training script
+    filtered_sentences <List> : filtered sentences for each publication
+    labels <List> : ground truth datasets for each publications
+
+    eg :
+    filtered_sentences[i] = 'Ta-Feng dataset includes 10000 transactional data'
+    labels[i] = ['Ta-Feng_2008', 'Ta-Feng_2010'] (all the datasets in the ith
+    publication)
+    """
+    dataset_word_dict = defaultdict(lambda: defaultdict(lambda: 0))
+    word_dataset_dict = defaultdict(lambda: defaultdict(lambda: 0))
+
+    for sent, datasets in zip(filtered_sentences, labels):
+        for dataset in datasets:
+            for w in sent.split(' '):
+                if dataset_word_dict[dataset][w] == 0:
+                    dataset_word_dict[dataset]['U_COUNT'] += 1
+                if word_dataset_dict[w][dataset] == 0:
+                    word_dataset_dict[w]['U_COUNT'] += 1
+
+                dataset_word_dict[dataset][w] += 1
+                dataset_word_dict[dataset]['COUNT'] += 1
+                word_dataset_dict[w][dataset] += 1
+                word_dataset_dict[w]['COUNT'] += 1
+    return dataset_word_dict, word_dataset_dict
+
+
+def predict(filtered_sentence, dataset_word_dict, word_dataset_dict,
+            top_k=5):
+    """
+    prediction step
+    filtered_sentence <str> : filtered sentences for a test instance
+    """
+    predictions = {}
+    datasets = len(list(dataset_word_dict.keys()))
+
+    for dataset in dataset_word_dict:
+        temp_score = 0
+        for w in filtered_sentence.split(' '):
+            if word_dataset_dict[w]['U_COUNT']:
+                temp_score += np.log(1 + datasets/word_dataset_dict[w]['U_COUNT']) * \
+                np.log((dataset_word_dict[dataset][w] + 1)/(word_dataset_dict[w]['COUNT'] + datasets))
+        predictions[dataset] = temp_score
+
+    sorted_preds = sorted(predictions.items(),
+                          key=lambda kv: kv[1],
+                          reverse=True)
+    return sorted_preds[:top_k]
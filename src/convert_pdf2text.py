@@ -2,15 +2,17 @@ import argparse
 
 from data_utils import (
     convert_pdf2text,
-    PUB_PDF_PATH, PUB_TXT_PATH)
+    PUB_PDF_PATH, PUB_TXT_PATH, MANIFEST_FILE)
 
 DATA_FOLDER = '../data/'
 PDF_FOLDER = DATA_FOLDER + PUB_PDF_PATH
 TEXT_FOLDER = DATA_FOLDER + PUB_TXT_PATH
+MANIFEST = DATA_FOLDER + MANIFEST_FILE
 
 
 def main(args):
-    convert_pdf2text(args.input_dir, args.output_dir)
+    convert_pdf2text(args.input_dir, args.output_dir,
+                     workers=args.workers, manifest_file=args.manifest)
 
 
 if __name__ == '__main__':
@@ -22,5 +24,12 @@ if __name__ == '__main__':
     parser.add_argument('--output_dir', type=str,
                         default=TEXT_FOLDER,
                         help='Folder to store rclc text files')
+    parser.add_argument('--workers', type=int,
+                        default=None,
+                        help='Number of conversion processes \
+                        (default: number of cpus)')
+    parser.add_argument('--manifest', type=str,
+                        default=MANIFEST,
+                        help='Download manifest listing validated pdf files')
     args = parser.parse_args()
     main(args)
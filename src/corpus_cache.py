@@ -0,0 +1,164 @@
+import json
+import mmap
+import os
+
+from typing import Iterator, List
+
+
+CACHE_VERSION = 2
+INDEX_SUFFIX = '.index.json'
+
+
+class CorpusCacheWriter:
+    """ Write corpus records into a packed cache file.
+        Every top-level field of a record is serialized (json) on its own
+        and appended to the pack file; the index file keeps, per collection
+        and per record, the offset and length of each field, and the size
+        of the pack. The index is removed before the pack is replaced, and
+        written last, on `close`. A field can be added to a record already
+        written (`set_field`), e.g. once values it depends on are known.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._part = filename + '.part'
+        self._pack = open(self._part, 'w+b')
+        self._offset = 0
+        self._collections = {}
+        self._meta = {}
+
+    def set_meta(self, key: str, value) -> None:
+        """ Small values stored in the index, e.g. the dataset index map.
+        """
+        self._meta[key] = value
+
+    def add(self, collection: str, record: dict) -> int:
+        """ Append a record to a collection, return its position.
+        """
+        fields = {name: self._write(value) for name, value in record.items()}
+        records = self._collections.setdefault(collection, [])
+        records.append(fields)
+        return len(records) - 1
+
+    def _write(self, value) -> list:
+        data = json.dumps(value).encode('utf-8')
+        self._pack.write(data)
+        location = [self._offset, len(data)]
+        self._offset += len(data)
+        return location
+
+    def set_field(self, collection: str, i: int, name: str, value) -> None:
+        """ Set a field of record `i` of a collection; the value is
+            appended to the pack.
+        """
+        self._collections[collection][i][name] = self._write(value)
+
+    def field(self, collection: str, name: str) -> list:
+        """ One field of every record written to a collection (None if
+            missing), read back from the pack.
+        """
+        self._pack.flush()
+        values = []
+        for locations in self._collections.get(collection, []):
+            if name not in locations:
+                values.append(None)
+                continue
+            offset, length = locations[name]
+            values.append(json.loads(os.pread(self._pack.fileno(), length,
+                                              offset).decode('utf-8')))
+        return values
+
+    def close(self) -> None:
+        self._pack.close()
+        # an old index must never describe the new pack
+        if os.path.exists(self.filename + INDEX_SUFFIX):
+            os.remove(self.filename + INDEX_SUFFIX)
+        os.replace(self._part, self.filename)
+        index = {
+            'version': CACHE_VERSION,
+            'pack_size': self._offset,
+            'meta': self._meta,
+            'collections': self._collections,
+        }
+        with open(self.filename + INDEX_SUFFIX + '.part', 'w') as f:
+            json.dump(index, f)
+        os.replace(self.filename + INDEX_SUFFIX + '.part',
+                   self.filename + INDEX_SUFFIX)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._pack.close()
+            os.remove(self._part)
+
+
+class CorpusCache:
+    """ Read-only access to a cache written by `CorpusCacheWriter`.
+        Only the index is read when opening the cache; records, and fields
+        of records, are decoded on demand from the memory-mapped pack file.
+    """
+
+    def __init__(self, filename: str):
+        index_file = filename + INDEX_SUFFIX
+        if not os.path.isfile(index_file):
+            raise ValueError(f'Cache file {filename} does not exist.')
+        with open(index_file, 'r') as f:
+            index = json.load(f)
+        if index.get('version') != CACHE_VERSION:
+            raise ValueError(f'Unsupported cache version in {filename}: '
+                             f'{index.get("version")}')
+        if index.get('pack_size') != os.path.getsize(filename):
+            raise ValueError(f'Index of {filename} does not match its pack.')
+        self.filename = filename
+        self.meta = index['meta']
+        self._collections = index['collections']
+        self._file = open(filename, 'rb')
+        self._data = mmap.mmap(self._file.fileno(), 0,
+                               access=mmap.ACCESS_READ) \
+            if os.path.getsize(filename) else b''
+
+    def close(self) -> None:
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def count(self, collection: str) -> int:
+        return len(self._collections.get(collection, []))
+
+    def _value(self, location: list):
+        offset, length = location
+        return json.loads(self._data[offset:offset + length].decode('utf-8'))
+
+    def get(self, collection: str, i: int, fields: List[str] = None) -> dict:
+        """ Record `i` of a collection, restricted to `fields` if given.
+        """
+        locations = self._collections[collection][i]
+        names = locations.keys() if fields is None else \
+            [f for f in fields if f in locations]
+        return {name: self._value(locations[name]) for name in names}
+
+    def iter(self, collection: str, fields: List[str] = None,
+             indexes: List[int] = None) -> Iterator[dict]:
+        """ Iterate over the records of a collection (or the given
+            positions), restricted to `fields` if given.
+        """
+        if indexes is None:
+            indexes = range(self.count(collection))
+        for i in indexes:
+            yield self.get(collection, i, fields)
+
+    def field(self, collection: str, name: str) -> list:
+        """ One field of every record of a collection (None if missing).
+        """
+        return [self._value(locations[name]) if name in locations else None
+                for locations in self._collections.get(collection, [])]
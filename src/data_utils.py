@@ -1,23 +1,47 @@
+import hashlib
 import json
+import lxml.html  # type: ignore
 import os
+import queue
+import readability.readability  # type: ignore
 import requests
 import shutil
+import subprocess
+import threading
 import time
 
 from bs4 import BeautifulSoup  # type: ignore
+from collections import deque
+from concurrent.futures import (
+    ProcessPoolExecutor, ThreadPoolExecutor, as_completed)
+from contextlib import contextmanager
 from pathlib import Path
 from pdfminer.pdfdocument import PDFDocument  # type: ignore
 from pdfminer.pdfpage import PDFTextExtractionNotAllowed  # type: ignore
 from pdfminer.pdfparser import PDFParser, PDFSyntaxError  # type: ignore
 from readability import Document  # type: ignore
+from readability.htmls import build_doc  # type: ignore
 from requests_html import HTMLSession  # type: ignore
 from tqdm import tqdm  # type: ignore
+from typing import Optional
 from urllib.parse import urlparse
 
-from rclc_conf import CACHE_PUB_FILE
+from corpus_cache import CorpusCache, CorpusCacheWriter, INDEX_SUFFIX
+from download_manifest import (
+    DownloadManifest, STATUS_OK, STATUS_UNVERIFIED, STATUS_FAILED)
+from rclc_conf import CACHE_PUB_FILE, CACHE_PACK_FILE
+from text_utils import read_text
 
 
 MAX_DOWNLOAD_TRIAL = 3
+MAX_WORKERS = 8
+HOST_INTERVAL = 0.5  # seconds between two requests to the same host
+HOST_CONNECTIONS = 2  # concurrent requests to the same host
+BACKOFF_DELAY = 5  # seconds before the first retry, doubled on every retry
+DOWNLOAD_TIMEOUT = (10, 20)
+PDFTOTEXT_TIMEOUT = 300  # seconds
+CORPUS_CHUNK_SIZE = 1 << 20  # characters read at once from corpus.jsonld
+USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/76.0.3809.132 Safari/537.36'
 
 RES_PATH = 'resource/'
 PUB_PATH = RES_PATH + 'pubs/'
@@ -26,14 +50,114 @@ DATASET_PATH = RES_PATH + 'dataset/'
 PUB_PDF_PATH = PUB_PATH + 'pdf/'
 PUB_TXT_PATH = PUB_PATH + 'text/'
 DATASET_PAGE_PATH = DATASET_PATH + 'html/'
+MANIFEST_FILE = RES_PATH + 'manifest.sqlite'
+
+# bump when the page parsing changes, to invalidate cached parsed pages
+PARSE_CACHE_TAG = b'dataset-html-v1\n'
+# readability >= 0.8 accepts an already parsed lxml tree
+_READABILITY_TREE_INPUT = hasattr(readability.readability, 'HtmlElement')
+_JSON_DELIMITERS = ' \t\n\r,:]}'  # characters that can follow a json value
 
 
 def load_corpus(filename: str) -> dict:
     """ Load corpus file (jsonld format)
     """
+    return list(iter_corpus(filename))
+
+
+class _JsonChunks:
+    """ Json values read one at a time from a file, `chunk_size`
+        characters at a time.
+    """
+
+    def __init__(self, f, chunk_size: int):
+        self._file = f
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _read(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self._file.read(self._chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """ Next non-whitespace character ('' at the end of the file).
+        """
+        while True:
+            while self.pos < len(self.buffer) and \
+                    self.buffer[self.pos] in ' \t\n\r':
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self._read():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, chars: str) -> str:
+        ch = self.peek()
+        if not ch or ch not in chars:
+            raise ValueError(f'Invalid corpus file: expected {chars!r} at '
+                             f'{ch!r}.')
+        self.pos += 1
+        return ch
+
+    def decode(self):
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buffer, self.pos)
+                # a number cut by the chunk ('2.' of '2.5') decodes too:
+                # it is complete once a delimiter follows it
+                number = isinstance(value, (int, float)) and \
+                    not isinstance(value, bool)
+                if self.eof or (end < len(self.buffer) and (
+                        not number or self.buffer[end] in _JSON_DELIMITERS)):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._read()
+
+
+def iter_corpus(filename: str, chunk_size: int = CORPUS_CHUNK_SIZE):
+    """ Iterate over the entities of the `@graph` of a corpus file (jsonld
+        format), decoding one entity at a time instead of loading the whole
+        file.
+    """
     with open(filename, 'r') as f:
-        corpus = json.load(f)
-        return corpus['@graph']
+        chunks = _JsonChunks(f, chunk_size)
+        chunks.expect('{')
+        if chunks.peek() == '}':
+            raise ValueError(f'No @graph in {filename}.')
+        graph = False
+        while True:
+            chunks.peek()
+            key = chunks.decode()
+            chunks.expect(':')
+            if key == '@graph':
+                graph = True
+                chunks.expect('[')
+                if chunks.peek() == ']':
+                    chunks.pos += 1
+                else:
+                    while True:
+                        chunks.peek()
+                        yield chunks.decode()
+                        if chunks.expect(',]') == ']':
+                            break
+            else:
+                chunks.peek()
+                chunks.decode()
+            if chunks.expect(',}') == '}':
+                break
+        if not graph:
+            raise ValueError(f'No @graph in {filename}.')
 
 
 def json_from_file(filename: str) -> dict:
@@ -72,38 +196,134 @@ def copy_pdf_resources(input_path: str,
         print(f'Unable to copy file: {e}')
 
 
+class _HostPool:
+    """ Sessions and politeness limits shared by the download workers.
+        Each host gets at most `connections` concurrent requests, started at
+        least `interval` seconds apart, and keeps its sessions (and their
+        connection pools) alive across downloads.
+    """
+
+    def __init__(self, interval: float = HOST_INTERVAL,
+                 connections: int = HOST_CONNECTIONS):
+        self.interval = interval
+        self.connections = connections
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _host(self, netloc: str) -> dict:
+        with self._lock:
+            if netloc not in self._hosts:
+                self._hosts[netloc] = {
+                    'slots': threading.Semaphore(self.connections),
+                    'lock': threading.Lock(),
+                    'next_request': 0.,
+                    'sessions': queue.LifoQueue(),
+                }
+            return self._hosts[netloc]
+
+    def wait(self, netloc: str) -> None:
+        """ Block until a new request to `netloc` is allowed.
+        """
+        host = self._host(netloc)
+        with host['lock']:
+            delay = host['next_request'] - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            host['next_request'] = time.monotonic() + self.interval
+
+    @contextmanager
+    def session(self, netloc: str):
+        """ Borrow a session for `netloc`, holding one of its connection
+            slots until the block exits.
+        """
+        host = self._host(netloc)
+        with host['slots']:
+            try:
+                session = host['sessions'].get_nowait()
+            except queue.Empty:
+                """ Special case: sciencedirect.com pages need to render the
+                    pdf download link
+                """
+                session = HTMLSession() \
+                    if netloc == 'www.sciencedirect.com' \
+                    else requests.Session()
+                session.headers['User-Agent'] = USER_AGENT
+            try:
+                yield session
+            finally:
+                host['sessions'].put(session)
+
+
 def _download(uri: str, res_type: str,
-              output_path: Path, e_id: str) -> bool:
-    """ download a resource and store in a file
+              output_path: Path, e_id: str,
+              hosts: _HostPool = None,
+              validators: dict = None) -> Optional[dict]:
+    """ download a resource and store in a file, retrying with exponential
+        backoff.
+        If `validators` (a manifest entry of a previous download) is given,
+        the request is conditional and an unchanged resource is not
+        transferred again.
+        Return the file name, size, sha256 and validators of the stored
+        file, or None if the download failed.
     """
     if res_type not in ['pdf', 'html', 'unknown']:
         raise ValueError(f'Invalid resource type: {res_type}')
+    if hosts is None:
+        hosts = _HostPool()
+    conditional = {}
+    if validators:
+        if validators.get('etag'):
+            conditional['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            conditional['If-Modified-Since'] = validators['last_modified']
     trial = 0
-    headers = requests.utils.default_headers()
-    headers['User-Agent'] = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/76.0.3809.132 Safari/537.36'
 
     while trial < MAX_DOWNLOAD_TRIAL:
         try:
             parsed_uri = urlparse(uri)
-            if parsed_uri.netloc == 'www.sciencedirect.com':
-                """ Special case: sciencedirect.com auto generates pdf
-                    download link in an intermediate page
-                """
-                session = HTMLSession()
-                r0 = session.get(uri)
-                res = session.get(list(r0.html.absolute_links)[0])
-            elif parsed_uri.netloc.endswith('onlinelibrary.wiley.com'):
-                """ Special case: wiley auto generates embed pdf to render pdf
-                """
-                r0 = requests.get(uri)
-                soup = BeautifulSoup(r0.content, 'html5lib')
-                src = soup.find('embed')['src']
-                res = requests.get(parsed_uri.scheme + '://' +
-                                   parsed_uri.netloc + src)
-            else:
-                res = requests.get(uri, headers=headers, timeout=(10, 20))
+            netloc = parsed_uri.netloc
+            with hosts.session(netloc) as session:
+                hosts.wait(netloc)
+                if netloc == 'www.sciencedirect.com':
+                    """ Special case: sciencedirect.com auto generates pdf
+                        download link in an intermediate page
+                    """
+                    r0 = session.get(uri, timeout=DOWNLOAD_TIMEOUT)
+                    res = session.get(list(r0.html.absolute_links)[0],
+                                      timeout=DOWNLOAD_TIMEOUT)
+                elif netloc.endswith('onlinelibrary.wiley.com'):
+                    """ Special case: wiley auto generates embed pdf to render
+                        pdf
+                    """
+                    r0 = session.get(uri, timeout=DOWNLOAD_TIMEOUT)
+                    soup = BeautifulSoup(r0.content, 'html5lib')
+                    src = soup.find('embed')['src']
+                    hosts.wait(netloc)
+                    res = session.get(parsed_uri.scheme + '://' +
+                                      netloc + src, timeout=DOWNLOAD_TIMEOUT)
+                else:
+                    res = session.get(uri, headers=conditional,
+                                      timeout=DOWNLOAD_TIMEOUT)
+            if res.status_code == 429 or res.status_code >= 500:
+                raise requests.exceptions.HTTPError(
+                    f'{res.status_code} for {uri}', response=res)
+            if res.status_code == 304 and validators:
+                return {
+                    'not_modified': True,
+                    'file_name': validators['file_name'],
+                    'size': validators['size'],
+                    'sha256': validators['sha256'],
+                    'etag': res.headers.get('etag', validators['etag']),
+                    'last_modified': res.headers.get(
+                        'last-modified', validators['last_modified']),
+                }
+            if res.status_code >= 400:
+                # other client errors will not go away on a retry; their
+                # error page is not the resource
+                print(f'{res.status_code} for {uri}')
+                return None
             if res_type == 'unknown':
-                content_type = res.headers["content-type"]
+                content_type = res.headers.get('content-type', '')
                 res_type = 'html' if 'text/html' in content_type else 'pdf'
             out_file = output_path / (e_id + '.' + res_type)
             out_file.write_bytes(res.content)
@@ -112,25 +332,108 @@ def _download(uri: str, res_type: str,
                     out_file.unlink()
                     trial += 1
                     continue
-            return True
+            return {
+                'not_modified': False,
+                'file_name': out_file.name,
+                'size': len(res.content),
+                'sha256': hashlib.sha256(res.content).hexdigest(),
+                'etag': res.headers.get('etag'),
+                'last_modified': res.headers.get('last-modified'),
+            }
         except requests.exceptions.RequestException as err:
             print(err)
-            time.sleep(5)
+            time.sleep(BACKOFF_DELAY * 2 ** trial)
             trial += 1
 
     if trial == MAX_DOWNLOAD_TRIAL:
         print(f'Failed downloading {uri} after {MAX_DOWNLOAD_TRIAL} attempts.')
-    return False
+    return None
+
+
+def _record_failed(manifest: DownloadManifest, uri: str, entities: list,
+                   entries: dict) -> None:
+    for _type, _id in entities:
+        # a failed refresh keeps a good earlier download
+        entry = entries.get((_type, _id))
+        if not entry or \
+                entry['status'] not in (STATUS_OK, STATUS_UNVERIFIED):
+            manifest.record(_id, _type, uri, STATUS_FAILED)
+
+
+def _fetch_entities(uri: str, res_type: str, output_path: Path,
+                    entities: list, entries: dict,
+                    manifest: DownloadManifest, hosts: _HostPool) -> bool:
+    """ Download `uri` once for all `entities` (list of (type, id)) sharing
+        it and record the outcome in the manifest.
+    """
+    first_type, first_id = entities[0]
+    previous = entries.get(entities[0])
+    validators = None
+    if previous and previous['status'] == STATUS_OK and \
+            (output_path / previous['file_name']).exists():
+        validators = previous
+    try:
+        result = _download(uri, res_type, output_path, first_id, hosts,
+                           validators)
+    except Exception as err:
+        # e.g. a publisher page without the expected pdf link
+        print(f'Failed downloading {uri}: {err!r}')
+        result = None
+
+    if result is None:
+        _record_failed(manifest, uri, entities, entries)
+        return False
+
+    source = output_path / result['file_name']
+    suffix = source.suffix
+    for _type, _id in entities:
+        file_name = _id + suffix
+        # a new body replaces the copies of every entity; after a 304 only
+        # the missing copies are made
+        if _id != first_id and (not result['not_modified'] or
+                                not (output_path / file_name).exists()):
+            shutil.copyfile(source, output_path / file_name)
+        manifest.record(_id, _type, uri, STATUS_OK, file_name,
+                        result['size'], result['sha256'], result['etag'],
+                        result['last_modified'])
+    return True
+
+
+def _record_downloaded(manifest: DownloadManifest, entities: list) -> None:
+    """ Record files downloaded before the manifest existed, so that they
+        are not fetched again. entities: list of (type, id, uri, path)
+        Pdf files were not validated: they are recorded as unverified, and
+        `convert_pdf2text` checks them.
+    """
+    files = {}
+    for _type, _id, uri, path in entities:
+        if path not in files:
+            files[path] = {f.stem: f for f in path.glob('*.*')}
+        f = files[path].get(_id)
+        if f is not None:
+            content = f.read_bytes()
+            status = STATUS_UNVERIFIED if f.suffix == '.pdf' else STATUS_OK
+            manifest.record(_id, _type, uri, status, f.name,
+                            len(content), hashlib.sha256(content).hexdigest())
 
 
 def download_resources(corpus: object,
                        output_path: str,
-                       force_download: bool = False) -> None:
+                       force_download: bool = False,
+                       workers: int = MAX_WORKERS,
+                       host_interval: float = HOST_INTERVAL) -> None:
     """ Download all publications pdf file and dataset html file from corpus
         data (if not downloaded yet).
         All downloaded files are stored under `resource/` folder in the
         `output_path`, organized separatedly for publication and datasets.
         We use the entity id as filename.
+        Downloads run on `workers` threads; requests to the same host are
+        spaced by `host_interval` seconds.
+        Every download is recorded in a manifest (`resource/manifest.sqlite`):
+        re-runs skip the entities downloaded successfully and retry the
+        failed ones. With `force_download`, successful downloads are
+        refreshed with conditional requests. Entities sharing a uri are
+        downloaded once.
     """
     pub_pdf_full_path = Path(output_path + PUB_PDF_PATH)
     dataset_page_full_path = Path(output_path + DATASET_PAGE_PATH)
@@ -139,52 +442,118 @@ def download_resources(corpus: object,
     if not dataset_page_full_path.exists():
         dataset_page_full_path.mkdir(parents=True)
 
-    downloaded_pubs = list(pub_pdf_full_path.glob('*.pdf'))
-    downloaded_pubs_id = set([f.stem for f in downloaded_pubs])
-    downloaded_datasets = list(dataset_page_full_path.glob('*.*'))
-    downloaded_datasets_id = set([f.stem for f in downloaded_datasets])
-
-    for entity in tqdm(corpus, ascii=True, desc='Fetch resources'):
+    resources = []
+    for entity in corpus:
         _id = urlparse(entity['@id']).fragment.split('-')[1]
         _type = entity['@type']
         if _type == 'ResearchPublication':
-            downloaded_before = _id in downloaded_pubs_id
-            res_uri = entity['openAccess']['@value']
-            if force_download or not downloaded_before:
-                if not _download(res_uri, 'pdf',
-                                 pub_pdf_full_path, _id):
-                    print(f'Failed to download {res_uri}')
-                time.sleep(0.5)
+            resources.append((_type, _id, entity['openAccess']['@value'],
+                              'pdf', pub_pdf_full_path))
         elif _type == 'Dataset':
-            downloaded_before = _id in downloaded_datasets_id
-            res_uri = entity['foaf:page']['@value']
-            output = Path(output_path + DATASET_PAGE_PATH + _id + '.' + _type)
-            if force_download or not downloaded_before:
-                if not _download(res_uri, 'unknown',
-                                 dataset_page_full_path, _id):
-                    print(f'Failed to download {res_uri}')
-                time.sleep(0.5)
+            resources.append((_type, _id, entity['foaf:page']['@value'],
+                              'unknown', dataset_page_full_path))
         else:
             raise Exception(f'Unknown Entity Type: {_type}')
 
+    manifest = DownloadManifest(output_path + MANIFEST_FILE)
+    if len(manifest) == 0:
+        _record_downloaded(manifest, [(_type, _id, uri, path) for
+                                      _type, _id, uri, _, path in resources])
+    entries = manifest.entries()
+
+    jobs = {}
+    for _type, _id, uri, res_type, path in resources:
+        entry = entries.get((_type, _id))
+        if force_download or not entry or \
+                entry['status'] not in (STATUS_OK, STATUS_UNVERIFIED):
+            jobs.setdefault((uri, res_type, path), []).append((_type, _id))
+
+    hosts = _HostPool(interval=host_interval)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_fetch_entities, uri, res_type, path,
+                                   entities, entries, manifest, hosts):
+                   (uri, entities)
+                   for (uri, res_type, path), entities in jobs.items()}
+        for future in tqdm(as_completed(futures), total=len(futures),
+                           ascii=True, desc='Fetch resources'):
+            uri, entities = futures[future]
+            try:
+                done = future.result()
+            except Exception as err:
+                # one job failing must not stop the others
+                print(f'Failed storing {uri}: {err!r}')
+                _record_failed(manifest, uri, entities, entries)
+                done = False
+            if not done:
+                print(f'Failed to download {uri}')
+    manifest.close()
+
+
+def _pdf2text(pdf_file: str, txt_file: str, check_pdf: bool) -> bool:
+    """ Convert one pdf file with pdftotext (run in a worker process).
+        The text is written to a temporary file first, so that an
+        interrupted conversion never looks up to date.
+    """
+    try:
+        if check_pdf and not is_valid_pdf_file(pdf_file):
+            print(pdf_file)
+            return False
+    except PDFTextExtractionNotAllowed as err:
+        print(f'Text extraction not allowed: {err}')
+        return False
+
+    part_file = txt_file + '.part'
+    # cmd = ['pdf2txt.py', '-o', part_file, pdf_file]
+    cmd = ['pdftotext', pdf_file, part_file]
+    try:
+        subprocess.run(cmd, check=True, timeout=PDFTOTEXT_TIMEOUT,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        os.replace(part_file, txt_file)
+        return True
+    except (subprocess.CalledProcessError,
+            subprocess.TimeoutExpired) as err:
+        print(f'Failed converting {pdf_file}: {err}')
+        if os.path.exists(part_file):
+            os.remove(part_file)
+        return False
+
 
 def convert_pdf2text(input_path: str,
-                     output_path: str) -> None:
+                     output_path: str,
+                     workers: int = None,
+                     manifest_file: str = None) -> None:
     """ Convert all pdf files in input_path into text files stored \
         in output_path.
+        A pdf is skipped when its text file is newer. Conversions run in
+        `workers` processes (default: one per cpu). Pdf files recorded as
+        downloaded in the manifest (`manifest_file`, see `download_resources`)
+        were validated at download time and are not parsed again.
     """
-    for file in tqdm(Path(input_path).glob('*.pdf'), ascii=True,
-                     desc='pdftotxt'):
+    validated = set()
+    if manifest_file and os.path.isfile(manifest_file):
+        manifest = DownloadManifest(manifest_file)
+        validated = set(entry['file_name'] for entry in
+                        manifest.entries(STATUS_OK).values()
+                        if entry['entity_type'] == 'ResearchPublication')
+        manifest.close()
+
+    jobs = []
+    for file in Path(input_path).glob('*.pdf'):
         txt_file = output_path + file.name + '.txt'
-        if not is_valid_pdf_file(input_path + file.name):
-            print(input_path + file.name)
-            continue
+        try:
+            if os.stat(txt_file).st_mtime >= file.stat().st_mtime:
+                continue
+        except FileNotFoundError:
+            pass
+        jobs.append((input_path + file.name, txt_file,
+                     file.name not in validated))
 
-        if not Path(txt_file).exists():
-            # cmd = f'pdf2txt.py -o {txt_file} {input_path + file.name}'
-            cmd = f'pdftotext {input_path + file.name} {txt_file}'
-            print(cmd)
-            os.system(cmd)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) \
+            as executor:
+        futures = [executor.submit(_pdf2text, *job) for job in jobs]
+        for future in tqdm(as_completed(futures), total=len(futures),
+                           ascii=True, desc='pdftotxt'):
+            future.result()
 
 
 def _clean_html_str(s: str) -> str:
@@ -197,42 +566,55 @@ def _clean_html_str(s: str) -> str:
         .strip()
 
 
-def _extract_meta_tags(html: str) -> dict:
-    """ Extract meta title and description from an html page
+def _extract_meta_tags(html) -> dict:
+    """ Extract meta title and description from an html page (raw page or
+        lxml tree)
     """
-    soup = BeautifulSoup(html, 'html5lib')
-    og_title = soup.find('meta', {'property': 'og:title'})
-    title = og_title['content'] if og_title else \
-        soup.title.string if soup.title else ''
-
-    meta_desc = soup.find('meta', {'name': 'description'})
-    description = meta_desc['content'] \
-        if meta_desc and 'content' in meta_desc else None
+    doc = html if isinstance(html, lxml.html.HtmlElement) \
+        else build_doc(html)[0]
+    og_title = _first(doc.xpath('//meta[@property="og:title"]'))
+    title_tag = _first(doc.iter('title'))
+    title = og_title.attrib['content'] if og_title is not None else \
+        title_tag.text if title_tag is not None else ''
+
+    meta_desc = _first(doc.xpath('//meta[@name="description"]'))
+    description = meta_desc.attrib['content'] \
+        if meta_desc is not None and 'content' in meta_desc else None
     if description is None:
-        og_desc = soup.find('meta', {'property': 'og:description'})
-        description = og_desc['content'] \
-            if og_desc and 'content' in og_desc else None
+        og_desc = _first(doc.xpath('//meta[@property="og:description"]'))
+        description = og_desc.attrib['content'] \
+            if og_desc is not None and 'content' in og_desc else None
     return {
         'title': _clean_html_str(title) if title else '',
         'description': description
     }
 
 
-def _extract_summary_content(html: str) -> str:
-    """ Extract summary content from an html page
+def _extract_summary_content(html) -> str:
+    """ Extract summary content from an html page (raw page, or lxml tree
+        if the installed readability accepts one)
     """
     doc = Document(html)
-    soup = BeautifulSoup(doc.summary(), 'html5lib')
-    p_tags = soup.find_all('p')
-    p_texts = [_clean_html_str(p.get_text()) for p in p_tags]
+    try:
+        summary = lxml.html.document_fromstring(doc.summary())
+    except lxml.etree.ParserError:
+        return ''
+    p_tags = summary.iter('p')
+    p_texts = [_clean_html_str(p.text_content()) for p in p_tags]
     content = ' '.join(p_texts)
     return content
 
 
+def _first(elements):
+    return next(iter(elements), None)
+
+
 def _parse_dataset_html(html_file: str) -> dict:
     """ Read dataset html file and parse important contents such as meta
         title, meta-description, and all main paragraph (extracted using
         readability extractor)
+        The page is parsed once with lxml; the tree is shared with
+        readability when it accepts parsed documents.
     """
     """ TODO: handle pdf files
     """
@@ -243,19 +625,183 @@ def _parse_dataset_html(html_file: str) -> dict:
         }
     with open(html_file, 'rb') as f:
         text = f.read()
+    doc = build_doc(text)[0]
+    # meta tags are read first: readability modifies the tree it is given
+    meta = _extract_meta_tags(doc)
     return {
-        'meta': _extract_meta_tags(text),
-        'summary': _extract_summary_content(text)
+        'meta': meta,
+        'summary': _extract_summary_content(
+            doc if _READABILITY_TREE_INPUT else text)
     }
 
 
+def _parse_dataset_page(html_file: str, cache_file: str = None) -> dict:
+    """ Parse one dataset page (run in a worker process) and store the
+        result in the parse cache.
+    """
+    parsed = _parse_dataset_html(html_file)
+    if cache_file:
+        with open(cache_file + '.part', 'w', encoding='utf-8') as f:
+            json.dump(parsed, f)
+        os.replace(cache_file + '.part', cache_file)
+    return parsed
+
+
+def parse_dataset_pages(html_files: list,
+                        cache_path: str = None,
+                        workers: int = None) -> dict:
+    """ Parse dataset html files in `workers` processes (default: one per
+        cpu). Return the parsed pages by file name.
+        Parsed pages are cached in `cache_path`, keyed by a hash of the file
+        content, so unchanged pages are never parsed again.
+    """
+    if cache_path:
+        os.makedirs(cache_path, exist_ok=True)
+    parsed = {}
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) \
+            as executor:
+        futures = {}
+        for html_file in html_files:
+            page, future = _submit_parse(executor, html_file, cache_path)
+            if future is None:
+                parsed[html_file] = page
+            else:
+                futures[future] = html_file
+        for future in tqdm(as_completed(futures), total=len(futures),
+                           ascii=True, desc='parsing datasets'):
+            parsed[futures[future]] = future.result()
+    return parsed
+
+
+def _submit_parse(executor, html_file: str, cache_path: str = None) -> tuple:
+    """ (parsed page, None) if `html_file` is in the parse cache, else
+        (None, future of the page parsed by `executor`)
+    """
+    cache_file = _parse_cache_file(html_file, cache_path)
+    if cache_file and os.path.isfile(cache_file):
+        return json_from_file(cache_file), None
+    return None, executor.submit(_parse_dataset_page, html_file, cache_file)
+
+
+def _parse_cache_path(html_path: str) -> str:
+    """ folder caching parsed dataset pages, e.g. `dataset/html_parsed/`
+    """
+    return html_path.rstrip('/') + '_parsed/'
+
+
+def _parse_cache_file(html_file: str, cache_path: str = None) -> str:
+    """ cache file of a parsed page, named after a hash of its content
+    """
+    if not cache_path:
+        return None
+    with open(html_file, 'rb') as f:
+        digest = hashlib.sha256(PARSE_CACHE_TAG + f.read())
+    return cache_path + digest.hexdigest() + '.json'
+
+
+def _read_corpus_cache(cache_file: str, fields: list = None) -> dict:
+    with CorpusCache(cache_file) as cache:
+        return {
+            'dataset_idx': cache.meta['dataset_idx'],
+            'datasets': list(cache.iter('datasets', fields)),
+            'pubs': list(cache.iter('pubs', fields))
+        }
+
+
+def _citation_ids(citations) -> list:
+    # ids of the 'cito:citesAsDataSource' of a publication
+    if isinstance(citations, list):
+        return [c['@id'] for c in citations]
+    elif isinstance(citations, dict):
+        return [citations['@id']]
+    raise ValueError(f'Unknown type: {type(citations)}')
+
+
+def build_corpus_cache(corpus_file: str,
+                       html_path: str,
+                       parsed_pub_path: str,
+                       cache_file: str,
+                       workers: int = None) -> dict:
+    """ Build the packed corpus cache in a single pass over `corpus_file`.
+        Entities are streamed (`iter_corpus`); every dataset, with its
+        parsed html page, and every publication, with its parsed
+        publication, is written to the cache as soon as it is complete, so
+        only a bounded number of records is held in memory. Records keep
+        their order in the corpus. Publications are written with their raw
+        citations; their citation indexes are set in a final pass over the
+        cache index, once every dataset is known.
+        Dataset pages are parsed in `workers` processes, with the parse
+        cache shared with `parse_dataset_pages`.
+        Output:
+            number of datasets and publications written
+    """
+    cache_path = _parse_cache_path(html_path)
+    os.makedirs(cache_path, exist_ok=True)
+    workers = workers or os.cpu_count()
+    dataset_idx = {}
+    datasets = deque()  # (dataset, parsed page future), in corpus order
+    counts = {'datasets': 0, 'pubs': 0}
+
+    def write_datasets(block):
+        # write the datasets whose page is parsed; with `block`, wait for
+        # the first one
+        while datasets and (block or datasets[0][1] is None or
+                            datasets[0][1].done()):
+            dataset, future = datasets.popleft()
+            if future is not None:
+                dataset['html'] = future.result()
+            writer.add('datasets', dataset)
+            counts['datasets'] += 1
+            block = False
+
+    with CorpusCacheWriter(cache_file) as writer, \
+            ProcessPoolExecutor(max_workers=workers) as executor:
+        for entity in tqdm(iter_corpus(corpus_file), ascii=True,
+                           desc='loading corpus'):
+            _type = entity['@type']
+            _id = urlparse(entity['@id']).fragment.split('-')[1]
+            if _type == 'Dataset':
+                dataset_idx[entity['@id']] = len(dataset_idx) + 1
+                html_file = html_path + _id + '.html'
+                future = None
+                if Path(html_file).exists():
+                    page, future = _submit_parse(executor, html_file,
+                                                 cache_path)
+                    if future is None:
+                        entity['html'] = page
+                datasets.append((entity, future))
+                write_datasets(len(datasets) > 4 * workers)
+            elif _type == 'ResearchPublication':
+                entity['parsed_pub'] = json_from_file(
+                    parsed_pub_path + _id + '.pdf.json')
+                writer.add('pubs', entity)
+                counts['pubs'] += 1
+        while datasets:
+            write_datasets(True)
+        ids = writer.field('pubs', '@id')
+        for i, citations in enumerate(
+                writer.field('pubs', 'cito:citesAsDataSource')):
+            citations = _citation_ids(citations)
+            missing = [c for c in citations if c not in dataset_idx]
+            if missing:
+                raise ValueError(f'{ids[i]} cites unknown datasets: '
+                                 f'{missing}')
+            writer.set_field('pubs', i, 'citation_idx',
+                             [dataset_idx[c] for c in citations])
+        writer.set_meta('dataset_idx', dataset_idx)
+    return counts
+
+
 def load_rclc_corpus(corpus_file: str,
                      html_path: str,
                      parsed_pub_path: str,
-                     force_compute=False):
+                     force_compute=False,
+                     fields: list = None,
+                     workers: int = None):
     """ This function loads rclc corpus and corresponding parsed publications
         for training.dataset. We expect the dataset html files and parsed publications (parsed using AllenAI science parser) are available.
-        The loaded dataset is cached into a json file, and subsequent data
+        The loaded dataset is cached into a packed cache file (see
+        `corpus_cache`, built by `build_corpus_cache`), and subsequent data
         load can utilize the cache file.
         Input:
             - corpus_file: location of `corpus.jsonld` file.
@@ -263,6 +809,11 @@ def load_rclc_corpus(corpus_file: str,
             - parsed_pub_path: path of parsed publication files.
             - force_compute: if True, then we recompute everything and ignore
                              cache file.
+            - fields: if given, only these fields of the datasets and
+                      publications are loaded from the cache file.
+            - workers: number of processes parsing dataset html files.
+                       Parsed pages are cached next to `html_path` (see
+                       `parse_dataset_pages`).
         Output:
             return an object containing dataset mapping index and a list of
             parsed publications
@@ -270,63 +821,44 @@ def load_rclc_corpus(corpus_file: str,
     data_path = corpus_file[:corpus_file.rfind('/') + 1]
     # print(f'data path: {data_path}')
 
+    cache_pack_file = data_path + CACHE_PACK_FILE
     cache_corpus_file = data_path + CACHE_PUB_FILE
-    if os.path.isfile(cache_corpus_file) and not force_compute:
-        return json_from_file(cache_corpus_file)
-
-    corpus = load_corpus(corpus_file)
-    datasets = [e for e in corpus if e['@type'] == 'Dataset']
-    dataset_idx = {dataset['@id']: (i + 1)
-                   for i, dataset in enumerate(datasets)}
-    datasets = [e for e in corpus if e['@type'] == 'Dataset']
-    for dataset in tqdm(datasets, ascii=True, desc='loading datasets'):
-        _id = urlparse(dataset['@id']).fragment.split('-')[1]
-        if Path(html_path + _id + '.html').exists():
-            dataset['html'] = _parse_dataset_html(html_path + _id + '.html')
-
-    pubs = [e for e in corpus if e['@type'] == 'ResearchPublication']
-    for pub in tqdm(pubs, ascii=True, desc='loading pubs'):
-        _id = urlparse(pub['@id']).fragment.split('-')[1]
-        parsed_pub = json_from_file(parsed_pub_path + _id + '.pdf.json')
-        pub['parsed_pub'] = parsed_pub
-
-        citations = pub['cito:citesAsDataSource']
-        if isinstance(citations, list):
-            pub['citation_idx'] = [dataset_idx[c['@id']] for c in citations]
-        elif isinstance(citations, dict):
-            pub['citation_idx'] = [dataset_idx[citations['@id']]]
-        else:
-            ValueError(f'Unknown type: {type(citations)}')
+    if not force_compute:
+        if os.path.isfile(cache_pack_file + INDEX_SUFFIX):
+            return _read_corpus_cache(cache_pack_file, fields)
+        if os.path.isfile(cache_corpus_file):
+            return json_from_file(cache_corpus_file)
 
-    # cache consolidated info
-    rclc_corpus = {
-        'dataset_idx': dataset_idx,
-        'datasets': datasets,
-        'pubs': pubs
-    }
-    with open(cache_corpus_file, 'w') as f:
-        f.write(json.dumps(rclc_corpus))
-    return rclc_corpus
+    build_corpus_cache(corpus_file, html_path, parsed_pub_path,
+                       cache_pack_file, workers)
+    return _read_corpus_cache(cache_pack_file, fields)
+
+
+def open_corpus_cache(data_path: str) -> CorpusCache:
+    """ Open the packed corpus cache written by `load_rclc_corpus` for lazy
+        access to single publications, datasets or fields.
+    """
+    return CorpusCache(data_path + CACHE_PACK_FILE)
 
 
-def load_rcc_cache_dataset(data_path: str) -> dict:
+def load_rcc_cache_dataset(data_path: str, fields: list = None) -> dict:
     """ This function loads cache dataset which contain parsed publication
         information and additional contextual information such as citation
         information and research methods
+        If `fields` is given, only these fields are loaded.
     """
+    cache_pack_file = data_path + CACHE_PACK_FILE
     cache_file = data_path + CACHE_PUB_FILE
-    if os.path.isfile(cache_file):
+    if os.path.isfile(cache_pack_file + INDEX_SUFFIX):
+        return _read_corpus_cache(cache_pack_file, fields)
+    elif os.path.isfile(cache_file):
         return json_from_file(cache_file)
     else:
         raise ValueError(f'Cache file {cache_file} does not exist.')
 
 
-def read_pub_text(text_file: str) -> str:
-    with open(text_file, 'r', encoding='utf-8') as f:
-        content = ''
-        for line in f:
-            content = content + line.rstrip('\n') + ' '
-        return content[:-1]
+def read_pub_text(text_file: str, use_mmap: bool = False) -> str:
+    return read_text(text_file, use_mmap)
 
 # if __name__ == '__main__':
 #     for f in tqdm(Path('../data/resource/dataset/html/').glob('*.html'),
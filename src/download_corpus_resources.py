@@ -2,7 +2,7 @@ import argparse
 
 from data_utils import (
     load_corpus, copy_pdf_resources, download_resources,
-    PUB_PDF_PATH)
+    PUB_PDF_PATH, MAX_WORKERS, HOST_INTERVAL)
 
 CORPUS_PATH = '../data/corpus.jsonld'
 
@@ -15,16 +15,19 @@ def profile_corpus(corpus):
     print(f'Number of datasets: {len(datasets)}')
 
 
-def prepare_resources(corpus: object) -> None:
+def prepare_resources(corpus: object,
+                      workers: int = MAX_WORKERS,
+                      host_interval: float = HOST_INTERVAL) -> None:
     data_folder = '../data/'
     # copy_pdf_resources(data_folder + 'resource/manual_download/',
     #                    data_folder + PUB_PDF_PATH)
-    download_resources(corpus, data_folder)
+    download_resources(corpus, data_folder, workers=workers,
+                       host_interval=host_interval)
 
 
 def main(args):
     corpus = load_corpus(args.input)
-    prepare_resources(corpus)
+    prepare_resources(corpus, args.workers, args.host_interval)
     profile_corpus(corpus)
 
 
@@ -34,5 +37,11 @@ if __name__ == '__main__':
     parser.add_argument('--input', type=str,
                         default=CORPUS_PATH,
                         help='rclc corpus file')
+    parser.add_argument('--workers', type=int,
+                        default=MAX_WORKERS,
+                        help='Number of concurrent downloads')
+    parser.add_argument('--host_interval', type=float,
+                        default=HOST_INTERVAL,
+                        help='Seconds between two requests to the same host')
     args = parser.parse_args()
     main(args)
@@ -0,0 +1,112 @@
+import sqlite3
+import threading
+import time
+
+from typing import Optional
+
+
+STATUS_OK = 'ok'
+# on disk before the manifest existed, not checked yet
+STATUS_UNVERIFIED = 'unverified'
+STATUS_FAILED = 'failed'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS resources (
+    entity_id TEXT NOT NULL,
+    entity_type TEXT NOT NULL,
+    uri TEXT NOT NULL,
+    status TEXT NOT NULL,
+    file_name TEXT,
+    size INTEGER,
+    sha256 TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (entity_type, entity_id)
+)
+'''
+
+_FIELDS = ['entity_id', 'entity_type', 'uri', 'status', 'file_name', 'size',
+           'sha256', 'etag', 'last_modified', 'attempts', 'updated_at']
+
+
+class DownloadManifest:
+    """ Persistent record of downloaded resources (sqlite).
+        One row per entity: uri, download status, stored file name, byte
+        size, sha256 of the content and the ETag / Last-Modified validators
+        returned by the server. A pdf is only recorded as `ok` once it
+        passed `is_valid_pdf_file`; pdf files found on disk are recorded as
+        `unverified`.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(filename, check_same_thread=False,
+                                     timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute(_SCHEMA)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                'SELECT COUNT(*) FROM resources').fetchone()[0]
+
+    def get(self, entity_type: str, entity_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                f'SELECT {", ".join(_FIELDS)} FROM resources '
+                'WHERE entity_type = ? AND entity_id = ?',
+                (entity_type, entity_id)).fetchone()
+        return dict(zip(_FIELDS, row)) if row else None
+
+    def entries(self, status: str = None) -> dict:
+        """ All entries (or those with the given status), by
+            (entity type, entity id).
+        """
+        query = f'SELECT {", ".join(_FIELDS)} FROM resources'
+        args = ()
+        if status is not None:
+            query += ' WHERE status = ?'
+            args = (status,)
+        with self._lock:
+            rows = self._conn.execute(query, args).fetchall()
+        return {(row[1], row[0]): dict(zip(_FIELDS, row)) for row in rows}
+
+    def record(self, entity_id: str, entity_type: str, uri: str,
+               status: str, file_name: str = None, size: int = None,
+               sha256: str = None, etag: str = None,
+               last_modified: str = None) -> None:
+        """ Insert or update the entry of an entity. A failed attempt only
+            updates the status and the attempt counter.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            if status != STATUS_FAILED:
+                self._conn.execute(
+                    'INSERT INTO resources (entity_id, entity_type, uri, '
+                    'status, file_name, size, sha256, etag, last_modified, '
+                    'attempts, updated_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?) '
+                    'ON CONFLICT(entity_type, entity_id) DO UPDATE SET '
+                    'uri = excluded.uri, status = excluded.status, '
+                    'file_name = excluded.file_name, size = excluded.size, '
+                    'sha256 = excluded.sha256, etag = excluded.etag, '
+                    'last_modified = excluded.last_modified, attempts = 0, '
+                    'updated_at = excluded.updated_at',
+                    (entity_id, entity_type, uri, status, file_name, size,
+                     sha256, etag, last_modified, now))
+            else:
+                self._conn.execute(
+                    'INSERT INTO resources (entity_id, entity_type, uri, '
+                    'status, attempts, updated_at) '
+                    'VALUES (?, ?, ?, ?, 1, ?) '
+                    'ON CONFLICT(entity_type, entity_id) DO UPDATE SET '
+                    'uri = excluded.uri, status = excluded.status, '
+                    'attempts = attempts + 1, '
+                    'updated_at = excluded.updated_at',
+                    (entity_id, entity_type, uri, status, now))
@@ -1,5 +1,17 @@
+import hashlib
+import heapq
+import json
 import numpy as np
+import os
+import scipy.sparse as sp
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+
+MODEL_FORMAT = 'einb-sparse'
+MODEL_VERSION = 2
+PENDING_IDS = 1 << 20  # word ids buffered per dataset by NBCounts
 
 
 def parameter_learn(filtered_sentences, labels):
@@ -31,24 +43,800 @@ def parameter_learn(filtered_sentences, labels):
     return dataset_word_dict, word_dataset_dict
 
 
+class NBCounts:
+    """
+    mergeable form of the count tables built by `parameter_learn`
+    counts <dict> : optional, dataset -> {word: count} to start from
+
+    Words are interned to integer ids (`words`, `word_idx`) and the counts
+    of every dataset are kept in a sparse row: sorted word ids and their
+    counts, in numpy arrays. Counts of separate shards of publications can
+    be added up, and the counts of some publications subtracted, e.g.
+    count_learn(s[:n], l[:n]) + count_learn(s[n:], l[n:]) gives the same
+    tables as parameter_learn(s, l). Datasets are kept in order of first
+    appearance, which is the order `predict` breaks ties with.
+    Lookups (`count`, `dataset_stats`, `word_stats`) never add entries.
+    """
+
+    def __init__(self, counts=None):
+        self.words = []
+        self.word_idx = {}
+        self.datasets = []
+        self.dataset_idx = {}
+        self._rows = []
+        # per dataset, word ids (and counts) not merged into the row yet
+        self._pending = []
+        self._pending_size = []
+        self._word_totals = None
+        for dataset, words in (counts or {}).items():
+            self._add(self._dataset(dataset), self._intern(words.keys()),
+                      np.fromiter(words.values(), dtype=np.int64,
+                                  count=len(words)))
+
+    def __len__(self):
+        return len(self.datasets)
+
+    def __eq__(self, other):
+        return isinstance(other, NBCounts) and \
+            self.to_dict() == other.to_dict()
+
+    def _intern(self, words):
+        word_idx = self.word_idx
+        ids = []
+        for w in words:
+            i = word_idx.get(w)
+            if i is None:
+                i = word_idx[w] = len(self.words)
+                self.words.append(w)
+            ids.append(i)
+        return np.array(ids, dtype=np.int64)
+
+    def _dataset(self, dataset):
+        i = self.dataset_idx.get(dataset)
+        if i is None:
+            i = self.dataset_idx[dataset] = len(self.datasets)
+            self.datasets.append(dataset)
+            self._rows.append((np.zeros(0, dtype=np.int64),
+                               np.zeros(0, dtype=np.int64)))
+            self._pending.append([])
+            self._pending_size.append(0)
+        return i
+
+    def _add(self, i, ids, counts=None):
+        self._pending[i].append((ids, counts))
+        self._pending_size[i] += len(ids)
+        self._word_totals = None
+        if self._pending_size[i] > PENDING_IDS:
+            self._row(i)
+
+    def _row(self, i):
+        """ (sorted word ids, counts) of dataset i
+        """
+        if self._pending[i]:
+            ids, counts = self._rows[i]
+            ids = [ids] + [p_ids for p_ids, _ in self._pending[i]]
+            counts = [counts] + [
+                np.ones(len(p_ids), dtype=np.int64) if p_counts is None
+                else p_counts for p_ids, p_counts in self._pending[i]]
+            self._rows[i] = _sum_duplicates(np.concatenate(ids),
+                                            np.concatenate(counts))
+            self._pending[i] = []
+            self._pending_size[i] = 0
+        return self._rows[i]
+
+    def update(self, filtered_sentences, labels):
+        """
+        add the counts of (filtered sentences, labels) publications in place
+        """
+        for sent, datasets in zip(filtered_sentences, labels):
+            if not datasets:
+                continue
+            ids = self._intern(sent.split(' '))
+            for dataset in datasets:
+                self._add(self._dataset(dataset), ids)
+        return self
+
+    def __iadd__(self, other):
+        ids_map = self._intern(other.words)
+        for j, dataset in enumerate(other.datasets):
+            ids, counts = other._row(j)
+            self._add(self._dataset(dataset), ids_map[ids], counts)
+        return self
+
+    def __add__(self, other):
+        return self.copy().__iadd__(other)
+
+    def __isub__(self, other):
+        # check everything first, so that a failed subtraction changes
+        # nothing
+        ids_map = np.array([self.word_idx.get(w, -1) for w in other.words],
+                           dtype=np.int64)
+        rows = {}
+        for j, dataset in enumerate(other.datasets):
+            o_ids, o_counts = other._row(j)
+            i = self.dataset_idx.get(dataset)
+            if i is None:
+                # an empty row of an unknown dataset subtracts nothing
+                if len(o_ids):
+                    raise ValueError(f'Cannot subtract the counts of unknown '
+                                     f'dataset {dataset!r}.')
+                continue
+            s_ids, s_counts = self._row(i)
+            mapped = ids_map[o_ids]
+            pos = np.minimum(np.searchsorted(s_ids, mapped),
+                             max(len(s_ids) - 1, 0))
+            valid = mapped >= 0
+            if len(s_ids):
+                valid &= (s_ids[pos] == mapped) & (s_counts[pos] >= o_counts)
+            else:
+                valid[:] = False
+            if not valid.all():
+                k = np.flatnonzero(~valid)[0]
+                raise ValueError(f'Cannot subtract {o_counts[k]} occurrences '
+                                 f'of {other.words[o_ids[k]]!r} from '
+                                 f'dataset {dataset!r}.')
+            counts = s_counts.copy()
+            counts[pos] -= o_counts
+            keep = counts > 0
+            rows[i] = (s_ids[keep], counts[keep])
+
+        for i, row in rows.items():
+            self._rows[i] = row
+        self._word_totals = None
+        kept = [i for i in range(len(self.datasets))
+                if len(self._rows[i][0]) or self._pending[i]]
+        if len(kept) < len(self.datasets):
+            self.datasets = [self.datasets[i] for i in kept]
+            self.dataset_idx = {d: i for i, d in enumerate(self.datasets)}
+            self._rows = [self._rows[i] for i in kept]
+            self._pending = [self._pending[i] for i in kept]
+            self._pending_size = [self._pending_size[i] for i in kept]
+        return self
+
+    def __sub__(self, other):
+        return self.copy().__isub__(other)
+
+    def copy(self):
+        copy = NBCounts()
+        copy.words = list(self.words)
+        copy.word_idx = dict(self.word_idx)
+        copy.datasets = list(self.datasets)
+        copy.dataset_idx = dict(self.dataset_idx)
+        copy._rows = [self._row(i) for i in range(len(self.datasets))]
+        copy._pending = [[] for _ in self.datasets]
+        copy._pending_size = [0 for _ in self.datasets]
+        return copy
+
+    def count(self, dataset, word):
+        """
+        number of times `word` occurs with `dataset`
+        """
+        i = self.dataset_idx.get(dataset)
+        w = self.word_idx.get(word)
+        if i is None or w is None:
+            return 0
+        ids, counts = self._row(i)
+        pos = np.searchsorted(ids, w)
+        if pos < len(ids) and ids[pos] == w:
+            return int(counts[pos])
+        return 0
+
+    def dataset_stats(self, dataset):
+        """
+        (U_COUNT, COUNT) of a dataset: distinct words and word occurrences
+        """
+        i = self.dataset_idx.get(dataset)
+        if i is None:
+            return 0, 0
+        ids, counts = self._row(i)
+        return len(ids), int(counts.sum())
+
+    def word_stats(self, word):
+        """
+        (U_COUNT, COUNT) of a word: datasets it occurs with and occurrences
+        """
+        w = self.word_idx.get(word)
+        if w is None:
+            return 0, 0
+        if self._word_totals is None:
+            n_words = len(self.words)
+            u_count = np.zeros(n_words, dtype=np.int64)
+            count = np.zeros(n_words, dtype=np.int64)
+            for i in range(len(self.datasets)):
+                ids, counts = self._row(i)
+                u_count[ids] += 1
+                count[ids] += counts
+            self._word_totals = (u_count, count)
+        u_count, count = self._word_totals
+        return int(u_count[w]), int(count[w])
+
+    def to_dict(self):
+        """
+        dataset -> {word: count}
+        """
+        words = self.words
+        result = {}
+        for i, dataset in enumerate(self.datasets):
+            ids, counts = self._row(i)
+            result[dataset] = {words[w]: int(c)
+                               for w, c in zip(ids.tolist(), counts.tolist())}
+        return result
+
+    def _ordered(self, datasets):
+        if datasets is None:
+            return list(self.datasets)
+        datasets = list(datasets)
+        if len(datasets) != len(self.datasets) or \
+                set(datasets) != set(self.datasets):
+            raise ValueError('The dataset order must list every dataset '
+                             'of the counts exactly once.')
+        return datasets
+
+    def to_tables(self, datasets=None):
+        """
+        (dataset_word_dict, word_dataset_dict) as returned by
+        `parameter_learn`, datasets in the given order if any
+        """
+        dataset_word_dict = defaultdict(lambda: defaultdict(lambda: 0))
+        word_dataset_dict = defaultdict(lambda: defaultdict(lambda: 0))
+        words = self.words
+        for dataset in self._ordered(datasets):
+            ids, counts = self._row(self.dataset_idx[dataset])
+            table = dataset_word_dict[dataset]
+            table['U_COUNT'] += len(ids)
+            table['COUNT'] += int(counts.sum())
+            for w, c in zip(ids.tolist(), counts.tolist()):
+                table[words[w]] += c
+                word_table = word_dataset_dict[words[w]]
+                word_table[dataset] += c
+                word_table['U_COUNT'] += 1
+                word_table['COUNT'] += c
+        return dataset_word_dict, word_dataset_dict
+
+    def to_sparse_model(self, datasets=None):
+        """
+        SparseModel with the same counts, datasets in the given order if any
+        """
+        datasets = self._ordered(datasets)
+        rows = [self._row(self.dataset_idx[d]) for d in datasets]
+        ids = np.concatenate([r[0] for r in rows]) if rows else \
+            np.zeros(0, dtype=np.int64)
+        data = np.concatenate([r[1] for r in rows]) if rows else \
+            np.zeros(0, dtype=np.int64)
+        # words that occur, in order of first appearance
+        used = np.unique(ids)
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(r[0]) for r in rows])
+        counts = sp.csr_matrix((data, np.searchsorted(used, ids), indptr),
+                               shape=(len(datasets), len(used)))
+        return SparseModel(datasets, [self.words[w] for w in used.tolist()],
+                           counts)
+
+
+def _sum_duplicates(ids, counts):
+    """ sorted unique ids and the summed counts of each
+    """
+    order = np.argsort(ids, kind='stable')
+    ids = ids[order]
+    counts = counts[order]
+    if len(ids) == 0:
+        return ids, counts
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    return ids[starts], np.add.reduceat(counts, starts)
+
+
+def count_learn(filtered_sentences, labels):
+    """
+    training counts of (filtered sentences, labels) publications, to be
+    merged with the counts of other shards
+    """
+    return NBCounts().update(filtered_sentences, labels)
+
+
+def _count_shard(args):
+    return count_learn(*args)
+
+
+def parallel_count_learn(filtered_sentences, labels, workers=None,
+                         n_shards=None):
+    """
+    count_learn over contiguous shards of the publications in a process
+    pool; the shard counts are merged in order
+    """
+    filtered_sentences = list(filtered_sentences)
+    labels = list(labels)
+    workers = workers or os.cpu_count() or 1
+    n_shards = max(1, min(n_shards or workers, len(filtered_sentences)))
+    bounds = np.linspace(0, len(filtered_sentences), n_shards + 1).astype(int)
+    shards = [(filtered_sentences[a:b], labels[a:b])
+              for a, b in zip(bounds[:-1], bounds[1:])]
+    total = NBCounts()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for counts in executor.map(_count_shard, shards):
+            total += counts
+    return total
+
+
+def save_counts(counts, path):
+    """
+    write NBCounts to a json file, e.g. to merge counts made on other nodes
+    """
+    rows = [counts._row(i) for i in range(len(counts.datasets))]
+    with open(path + '.part', 'w', encoding='utf-8') as f:
+        json.dump({'words': counts.words,
+                   'datasets': counts.datasets,
+                   'rows': [[ids.tolist(), c.tolist()] for ids, c in rows]},
+                  f, ensure_ascii=False)
+    os.replace(path + '.part', path)
+
+
+def load_counts(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    counts = NBCounts()
+    counts.words = data['words']
+    counts.word_idx = {w: i for i, w in enumerate(counts.words)}
+    for dataset, (ids, c) in zip(data['datasets'], data['rows']):
+        counts._add(counts._dataset(dataset), np.array(ids, dtype=np.int64),
+                    np.array(c, dtype=np.int64))
+    return counts
+
+
 def predict(filtered_sentence, dataset_word_dict, word_dataset_dict,
             top_k=5):
     """
     prediction step
     filtered_sentence <str> : filtered sentences for a test instance
+
+    word_dataset_dict is used as an inverted index: only datasets sharing a
+    word with the query are scored word by word. Every other dataset gets
+    the same score, sum over the query words of
+    log(1 + D/U_COUNT) * log(1/(COUNT + D)), which is computed once and is
+    lower than the score of any dataset sharing a word with the query.
     """
-    predictions = {}
     datasets = len(list(dataset_word_dict.keys()))
 
+    query = []
+    for w in filtered_sentence.split(' '):
+        word_counts = word_dataset_dict.get(w)
+        if word_counts is not None and word_counts.get('U_COUNT', 0):
+            query.append((w, word_counts))
+
+    baseline = 0
+    candidates = set()
+    for w, word_counts in query:
+        baseline += np.log(1 + datasets/word_counts['U_COUNT']) * \
+            np.log((0 + 1)/(word_counts['COUNT'] + datasets))
+        candidates.update(d for d, c in word_counts.items()
+                          if c and d != 'U_COUNT' and d != 'COUNT')
+
+    predictions = []
+    others = []
     for dataset in dataset_word_dict:
+        if dataset not in candidates:
+            if len(others) < top_k:
+                others.append((dataset, baseline))
+            continue
+        word_counts = dataset_word_dict[dataset]
         temp_score = 0
-        for w in filtered_sentence.split(' '):
-            if word_dataset_dict[w]['U_COUNT']:
-                temp_score += np.log(1 + datasets/word_dataset_dict[w]['U_COUNT']) * \
-                np.log((dataset_word_dict[dataset][w] + 1)/(word_dataset_dict[w]['COUNT'] + datasets))
-        predictions[dataset] = temp_score
-
-    sorted_preds = sorted(predictions.items(),
-                          key=lambda kv: kv[1],
-                          reverse=True)
-    return sorted_preds[:top_k]
+        for w, counts in query:
+            temp_score += np.log(1 + datasets/counts['U_COUNT']) * \
+                np.log((word_counts.get(w, 0) + 1)/(counts['COUNT'] + datasets))
+        predictions.append((dataset, temp_score))
+
+    sorted_preds = heapq.nlargest(top_k, predictions, key=lambda kv: kv[1])
+    return (sorted_preds + others)[:top_k]
+
+
+class SparseModel:
+    """
+    sparse-matrix form of the count tables built by `parameter_learn`
+    datasets <List> : dataset ids, one per matrix row
+    words <List> : vocabulary, one word per matrix column
+    counts <csr_matrix> : number of times a word occurs with a dataset
+
+    The per-word terms of the `predict` score are precomputed:
+    log_idf[w] = log(1 + D / U_COUNT[w]), log_denom[w] = log(COUNT[w] + D)
+    and log_counts[d, w] = log(count[d, w] + 1) for the non-zero counts,
+    stored both by dataset (CSR) and by word (CSC).
+    """
+
+    def __init__(self, datasets, words, counts, weights=None):
+        self.datasets = list(datasets)
+        self.words = list(words)
+        self.word_idx = {w: i for i, w in enumerate(self.words)}
+        if weights is None:
+            self.counts = sp.csr_matrix(counts, dtype=np.int64)
+            self.compute_weights()
+        else:
+            # precomputed arrays, e.g. memory-mapped by `load_model`
+            self.counts = counts
+            for name, value in weights.items():
+                setattr(self, name, value)
+
+    @property
+    def vocab_hash(self):
+        return _vocab_hash(self.words)
+
+    def compute_weights(self):
+        n_datasets = len(self.datasets)
+        counts = self.counts
+        self.u_count = np.bincount(counts.indices,
+                                   minlength=len(self.words))
+        self.count = np.asarray(counts.sum(axis=0)).ravel()
+        self.log_idf = np.log(1 + n_datasets / self.u_count)
+        self.log_denom = np.log(self.count + n_datasets)
+        self.log_counts = sp.csr_matrix(
+            (np.log(counts.data + 1.), counts.indices, counts.indptr),
+            shape=counts.shape)
+        # word -> datasets inverted index used by `sparse_predict`
+        self.log_counts_csc = self.log_counts.tocsc()
+
+
+def sparse_parameter_learn(filtered_sentences, labels):
+    """
+    training script, same counts as `parameter_learn` in a SparseModel
+    filtered_sentences <List> : filtered sentences for each publication
+    labels <List> : ground truth datasets for each publications
+    """
+    dataset_idx = {}
+    word_idx = {}
+    rows = []
+    cols = []
+    for sent, datasets in zip(filtered_sentences, labels):
+        # like `parameter_learn`, a publication without labels adds no word
+        if not datasets:
+            continue
+        ids = np.array([word_idx.setdefault(w, len(word_idx))
+                        for w in sent.split(' ')], dtype=np.int64)
+        for dataset in datasets:
+            row = dataset_idx.setdefault(dataset, len(dataset_idx))
+            rows.append(np.full(len(ids), row, dtype=np.int64))
+            cols.append(ids)
+    rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+    cols = np.concatenate(cols) if cols else np.zeros(0, dtype=np.int64)
+    # duplicate (dataset, word) entries are summed up
+    counts = sp.coo_matrix((np.ones(len(rows), dtype=np.int64),
+                            (rows, cols)),
+                           shape=(len(dataset_idx), len(word_idx)))
+    return SparseModel(dataset_idx, word_idx, counts.tocsr())
+
+
+def update(model, filtered_sentences, labels):
+    """
+    fold new publications into a SparseModel, same model as
+    `sparse_parameter_learn` over the old and the new publications
+    (new words and datasets are appended in order of first appearance,
+    publications without labels are skipped)
+    filtered_sentences <List> : filtered sentences for each new publication
+    labels <List> : ground truth datasets for each new publication
+
+    returns a new SparseModel, `model` (possibly memory-mapped) is left as
+    is. log_counts is recomputed for the datasets of the new publications
+    only, log_idf and log_denom for their words only, unless the number of
+    datasets changed.
+    """
+    n_datasets, n_words = model.counts.shape
+    datasets = list(model.datasets)
+    dataset_idx = {d: i for i, d in enumerate(datasets)}
+    words = list(model.words)
+    word_idx = dict(model.word_idx)
+    rows = []
+    cols = []
+    for sent, pub_datasets in zip(filtered_sentences, labels):
+        if not pub_datasets:
+            continue
+        ids = np.array([word_idx.setdefault(w, len(word_idx))
+                        for w in sent.split(' ')], dtype=np.int64)
+        for dataset in pub_datasets:
+            row = dataset_idx.setdefault(dataset, len(dataset_idx))
+            rows.append(np.full(len(ids), row, dtype=np.int64))
+            cols.append(ids)
+    datasets.extend(list(dataset_idx)[n_datasets:])
+    words.extend(list(word_idx)[n_words:])
+    shape = (len(datasets), len(words))
+    rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+    cols = np.concatenate(cols) if cols else np.zeros(0, dtype=np.int64)
+    delta = sp.coo_matrix((np.ones(len(rows), dtype=np.int64),
+                           (rows, cols)), shape=shape).tocsr()
+
+    old = model.counts
+    old_log = model.log_counts
+    if not old.has_sorted_indices:
+        old = old.sorted_indices()
+        old_log = old_log.sorted_indices()
+    indptr = np.concatenate([old.indptr, np.full(
+        shape[0] - n_datasets, old.indptr[-1], dtype=old.indptr.dtype)])
+    old = sp.csr_matrix((old.data, old.indices, indptr), shape=shape)
+    counts = old + delta
+    counts.sort_indices()
+
+    # rows of the datasets without new publications keep their entries
+    touched = np.diff(delta.indptr) > 0
+    new_mask = np.repeat(touched, np.diff(counts.indptr))
+    old_mask = np.repeat(touched, np.diff(old.indptr))
+    log_data = np.empty(len(counts.data))
+    log_data[~new_mask] = old_log.data[~old_mask]
+    log_data[new_mask] = np.log(counts.data[new_mask] + 1.)
+    log_counts = sp.csr_matrix((log_data, counts.indices, counts.indptr),
+                               shape=shape)
+
+    # counts only grow: the datasets of a word are only added to
+    pad = shape[1] - n_words
+    u_count = np.concatenate([model.u_count, np.zeros(pad, dtype=np.int64)])
+    u_count += np.bincount(counts.indices[new_mask], minlength=shape[1])
+    u_count -= np.bincount(old.indices[old_mask], minlength=shape[1])
+    count = np.concatenate([model.count, np.zeros(pad, dtype=np.int64)])
+    count += np.asarray(delta.sum(axis=0)).ravel()
+
+    if shape[0] != n_datasets:
+        log_idf = np.log(1 + shape[0] / u_count)
+        log_denom = np.log(count + shape[0])
+    else:
+        log_idf = np.concatenate([model.log_idf, np.zeros(pad)])
+        log_denom = np.concatenate([model.log_denom, np.zeros(pad)])
+        ids = np.unique(delta.indices)
+        log_idf[ids] = np.log(1 + shape[0] / u_count[ids])
+        log_denom[ids] = np.log(count[ids] + shape[0])
+
+    weights = {
+        'log_counts': log_counts,
+        'log_counts_csc': log_counts.tocsc(),
+        'u_count': u_count,
+        'count': count,
+        'log_idf': log_idf,
+        'log_denom': log_denom,
+    }
+    return SparseModel(datasets, words, counts, weights)
+
+
+def sparse_model_from_tables(dataset_word_dict, word_dataset_dict):
+    """
+    convert the count tables returned by `parameter_learn` to a SparseModel
+    """
+    datasets = list(dataset_word_dict.keys())
+    words = [w for w in word_dataset_dict
+             if word_dataset_dict[w].get('U_COUNT', 0)]
+    word_idx = {w: i for i, w in enumerate(words)}
+    rows = []
+    cols = []
+    data = []
+    for row, dataset in enumerate(datasets):
+        for w, c in dataset_word_dict[dataset].items():
+            if c and w not in ('U_COUNT', 'COUNT') and w in word_idx:
+                rows.append(row)
+                cols.append(word_idx[w])
+                data.append(c)
+    counts = sp.coo_matrix((np.array(data, dtype=np.int64), (rows, cols)),
+                           shape=(len(datasets), len(words)))
+    return SparseModel(datasets, words, counts.tocsr())
+
+
+def _query_vector(filtered_sentence, model):
+    """ word ids of the known query words and their idf-weighted counts
+    """
+    word_idx = model.word_idx
+    ids = [word_idx[w] for w in filtered_sentence.split(' ')
+           if w in word_idx]
+    ids, tf = np.unique(np.array(ids, dtype=np.int64), return_counts=True)
+    return ids, tf * model.log_idf[ids]
+
+
+def _top_k(scores, top_k):
+    """ indices of the top_k scores, highest first; ties keep the lowest
+        index first, like the stable sort in `predict`
+    """
+    n = len(scores)
+    if top_k <= 0 or n == 0:
+        return np.zeros(0, dtype=np.int64)
+    if top_k < n:
+        part = np.argpartition(-scores, top_k - 1)[:top_k]
+        threshold = scores[part].min()
+        above = np.flatnonzero(scores > threshold)
+        ties = np.flatnonzero(scores == threshold)[:top_k - len(above)]
+        idx = np.concatenate([above, ties])
+    else:
+        idx = np.arange(n)
+    return idx[np.lexsort((idx, -scores[idx]))]
+
+
+def sparse_predict(filtered_sentence, model, top_k=5):
+    """
+    prediction step on a SparseModel, same scores as `predict`
+    filtered_sentence <str> : filtered sentences for a test instance
+
+    Only the datasets found in the columns of the query words are scored,
+    see `predict` for the score of the other datasets.
+    """
+    ids, weights = _query_vector(filtered_sentence, model)
+    baseline = 0.0 - weights.dot(model.log_denom[ids])
+
+    index = model.log_counts_csc
+    starts = index.indptr[ids]
+    ends = index.indptr[ids + 1]
+    rows = np.concatenate([index.indices[s:e] for s, e in zip(starts, ends)]
+                          + [np.zeros(0, dtype=index.indices.dtype)])
+    values = np.concatenate([index.data[s:e] for s, e in zip(starts, ends)]
+                            + [np.zeros(0)])
+    values *= np.repeat(weights, ends - starts)
+    candidates, inverse = np.unique(rows, return_inverse=True)
+    scores = np.bincount(inverse, weights=values,
+                         minlength=len(candidates)) + baseline
+
+    preds = [(model.datasets[candidates[i]], float(scores[i]))
+             for i in _top_k(scores, top_k)]
+    if len(preds) < top_k:
+        scored = set(candidates.tolist())
+        for i, dataset in enumerate(model.datasets):
+            if len(preds) == top_k:
+                break
+            if i not in scored:
+                preds.append((dataset, float(baseline)))
+    return preds
+
+
+def _query_matrix(filtered_sentences, model):
+    """ document x word matrix of idf-weighted counts of the known words
+    """
+    word_idx = model.word_idx
+    indptr = [0]
+    indices = []
+    for sent in filtered_sentences:
+        indices.extend(word_idx[w] for w in sent.split(' ') if w in word_idx)
+        indptr.append(len(indices))
+    indices = np.array(indices, dtype=np.int64)
+    data = model.log_idf[indices]
+    # duplicate words of a document are summed up
+    query = sp.csr_matrix((data, indices, np.array(indptr, dtype=np.int64)),
+                          shape=(len(filtered_sentences), len(model.words)))
+    query.sum_duplicates()
+    return query
+
+
+def predict_batch(filtered_sentences, model, top_k=5, chunk_size=None):
+    """
+    prediction step for many publications at once on a SparseModel
+    filtered_sentences <List> : filtered sentences for each test instance
+    chunk_size <int> : number of publications scored per matrix product,
+    bounds the dense chunk_size x datasets score matrix (default: all)
+
+    returns one `sparse_predict` result per publication
+    """
+    if not chunk_size:
+        chunk_size = max(len(filtered_sentences), 1)
+    # the transpose of the CSC copy is a CSR view, no entry is copied
+    log_counts_t = model.log_counts_csc.T
+    results = []
+    for start in range(0, len(filtered_sentences), chunk_size):
+        query = _query_matrix(filtered_sentences[start:start + chunk_size],
+                              model)
+        scores = query.dot(log_counts_t).toarray()
+        scores -= query.dot(model.log_denom)[:, np.newaxis]
+        for row in scores:
+            results.append([(model.datasets[i], float(row[i]))
+                            for i in _top_k(row, top_k)])
+    return results
+
+
+_MODEL_ARRAYS = ['counts_indptr', 'counts_indices', 'counts_data',
+                 'log_counts_data', 'csc_indptr', 'csc_indices', 'csc_data',
+                 'u_count', 'count', 'log_idf', 'log_denom']
+
+
+def _vocab_hash(words):
+    return hashlib.sha256(
+        json.dumps(words, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+@contextmanager
+def _replacing(filename, mode):
+    # write to a temporary file of the same folder, then rename it over
+    # `filename`: the old file keeps its inode, so a model memory-mapped
+    # by `load_model` still reads the old bytes
+    part = filename + '.part'
+    encoding = None if 'b' in mode else 'utf-8'
+    try:
+        with open(part, mode, encoding=encoding) as f:
+            yield f
+    except BaseException:
+        os.remove(part)
+        raise
+    os.replace(part, filename)
+
+
+def save_model(model, path):
+    """
+    store a SparseModel in the folder `path`: vocabulary and dataset ids in
+    vocab.json, every array in its own .npy file, and a header.json written
+    last with the format version and the vocabulary hash; every file is
+    replaced by a new one, models loaded from `path` are not affected
+    """
+    os.makedirs(path, exist_ok=True)
+    header_file = os.path.join(path, 'header.json')
+    if os.path.isfile(header_file):
+        os.remove(header_file)
+
+    arrays = {
+        'counts_indptr': model.counts.indptr,
+        'counts_indices': model.counts.indices,
+        'counts_data': model.counts.data,
+        'log_counts_data': model.log_counts.data,
+        'csc_indptr': model.log_counts_csc.indptr,
+        'csc_indices': model.log_counts_csc.indices,
+        'csc_data': model.log_counts_csc.data,
+        'u_count': model.u_count,
+        'count': model.count,
+        'log_idf': model.log_idf,
+        'log_denom': model.log_denom,
+    }
+    for name in _MODEL_ARRAYS:
+        with _replacing(os.path.join(path, name + '.npy'), 'wb') as f:
+            np.save(f, np.ascontiguousarray(arrays[name]))
+    with _replacing(os.path.join(path, 'vocab.json'), 'w') as f:
+        json.dump({'datasets': model.datasets, 'words': model.words}, f,
+                  ensure_ascii=False)
+    header = {
+        'format': MODEL_FORMAT,
+        'version': MODEL_VERSION,
+        'vocab_hash': model.vocab_hash,
+        'n_datasets': len(model.datasets),
+        'n_words': len(model.words),
+        'nnz': int(model.counts.nnz),
+    }
+    with _replacing(header_file, 'w') as f:
+        json.dump(header, f)
+
+
+def load_model(path, vocab_hash=None, mmap_mode='r'):
+    """
+    load a SparseModel stored by `save_model`; arrays are memory-mapped
+    (mmap_mode=None reads them into memory instead)
+    vocab_hash <str> : if given, reject a model built from another vocabulary
+    """
+    header_file = os.path.join(path, 'header.json')
+    if not os.path.isfile(header_file):
+        raise ValueError(f'No model found in {path}.')
+    with open(header_file, 'r') as f:
+        header = json.load(f)
+    if header.get('format') != MODEL_FORMAT or \
+            header.get('version') != MODEL_VERSION:
+        raise ValueError(f'Unsupported model format in {path}: '
+                         f'{header.get("format")} v{header.get("version")}')
+    if vocab_hash is not None and header['vocab_hash'] != vocab_hash:
+        raise ValueError(f'Model in {path} was built from another '
+                         f'vocabulary.')
+
+    try:
+        with open(os.path.join(path, 'vocab.json'), 'r',
+                  encoding='utf-8') as f:
+            vocab = json.load(f)
+        arrays = {name: np.load(os.path.join(path, name + '.npy'),
+                                mmap_mode=mmap_mode)
+                  for name in _MODEL_ARRAYS}
+    except (OSError, ValueError) as err:
+        # a missing or truncated file of a partly written model
+        raise ValueError(f'Incomplete model in {path}: {err}') from err
+    if len(vocab['words']) != header['n_words'] or \
+            len(vocab['datasets']) != header['n_datasets'] or \
+            _vocab_hash(vocab['words']) != header['vocab_hash']:
+        raise ValueError(f'Vocabulary of {path} does not match its header.')
+
+    shape = (header['n_datasets'], header['n_words'])
+    if len(arrays['counts_data']) != header['nnz'] or \
+            len(arrays['log_idf']) != header['n_words']:
+        raise ValueError(f'Arrays of {path} do not match its header.')
+    counts = sp.csr_matrix((arrays['counts_data'], arrays['counts_indices'],
+                            arrays['counts_indptr']), shape=shape, copy=False)
+    weights = {
+        'log_counts': sp.csr_matrix(
+            (arrays['log_counts_data'], arrays['counts_indices'],
+             arrays['counts_indptr']), shape=shape, copy=False),
+        'log_counts_csc': sp.csc_matrix(
+            (arrays['csc_data'], arrays['csc_indices'],
+             arrays['csc_indptr']), shape=shape, copy=False),
+        'u_count': arrays['u_count'],
+        'count': arrays['count'],
+        'log_idf': arrays['log_idf'],
+        'log_denom': arrays['log_denom'],
+    }
+    return SparseModel(vocab['datasets'], vocab['words'], counts, weights)
@@ -1,3 +1,12 @@
+import einb
+import numpy as np
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+from rclc_conf import RAND_SEED
+from sklearn.model_selection import KFold
+from statistics import mean
+
 
 def top5UptoD_err(y_true, y_pred):
     """ Evaluation metric used by rclc.
@@ -55,3 +64,147 @@ def top5UptoD_prec(y_true, y_pred):
         if correct == _D:
             break
     return (correct * 1.) / m
+
+
+def _padded(rows, width, name):
+    # ragged lists of ids as a matrix; padding is -1
+    lengths = np.array([len(row) for row in rows], dtype=np.int64)
+    if width is None:
+        width = int(lengths.max()) if len(lengths) else 0
+    elif len(lengths) and lengths.max() > width:
+        raise ValueError(f'the length of {name} must be at most {width}.')
+    matrix = np.full((len(rows), width), -1, dtype=np.int64)
+    mask = np.arange(width) < lengths[:, None]
+    if mask.any():
+        matrix[mask] = np.concatenate([np.asarray(row, dtype=np.int64)
+                                       for row in rows if len(row)])
+    return matrix, mask
+
+
+def evaluate_corpus(y_true_list, y_pred_matrix):
+    """ top5UptoD metrics of a whole test set, computed at once.
+        Datasets are encoded as non-negative integers (e.g. citation_idx
+        ids).
+        Input:
+            - y_true_list: ground truth ids of each publication
+            - y_pred_matrix: top 5 predicted ids of each publication; rows
+              of fewer than 5 ids are padded with -1, and negative ids
+              (padding) never match
+        Output:
+            - summary report: mean top5UptoD precision and error, precision
+              at k (k = 1..5), the same metrics per number of ground truths
+              (capped to 5), and the values of every publication (`precs`,
+              `errs`, equal to top5UptoD_prec / top5UptoD_err of the padded
+              predictions)
+    """
+    n_pubs = len(y_true_list)
+    if len(y_pred_matrix) != n_pubs:
+        raise ValueError(f'y_pred_matrix must have one row per publication.')
+    y_pred, _ = _padded(y_pred_matrix, 5, 'y_pred')
+    y_true, valid = _padded(y_true_list, None, 'y_true')
+    n_true = valid.sum(axis=1)
+    if n_pubs == 0 or not n_true.all():
+        raise ValueError(f'Error: No ground truth!')
+    if (y_true[valid] < 0).any():
+        raise ValueError(f'Ground truth ids must be non-negative.')
+
+    # every prediction against the ground truths of its own publication;
+    # padding of the ground truths is masked out
+    hits = ((y_pred[:, :, None] == y_true[:, None, :]) &
+            valid[:, None, :]).any(axis=2)
+
+    correct = np.cumsum(hits, axis=1)
+    _D = np.minimum(n_true, 5)
+    # predictions are read until D of them are correct
+    done = correct == _D[:, None]
+    m = np.where(done.any(axis=1), done.argmax(axis=1) + 1, 5)
+    rows = np.arange(n_pubs)
+    precs = (correct[rows, m - 1] * 1.) / m
+    errs = ((m - correct[rows, m - 1]) * 1.) / m
+
+    by_n_true = {}
+    for d in np.unique(_D):
+        mask = _D == d
+        by_n_true[int(d)] = {'n': int(mask.sum()),
+                             'prec': float(precs[mask].mean()),
+                             'err': float(errs[mask].mean())}
+    return {
+        'n': n_pubs,
+        'prec': float(precs.mean()),
+        'err': float(errs.mean()),
+        'prec_at_k': (correct / np.arange(1, 6)).mean(axis=0).tolist(),
+        'by_n_true': by_n_true,
+        'precs': precs.tolist(),
+        'errs': errs.tolist(),
+    }
+
+
+_CV_STATE = {}
+
+
+def _init_cv_worker(contexts, labels, counts, top_k):
+    _CV_STATE.update(contexts=contexts, labels=labels, counts=counts,
+                     top_k=top_k)
+
+
+def _evaluate_fold(args):
+    """ Train on everything but `test_index`, by subtracting the counts of
+        the held-out publications from the counts of the whole corpus, and
+        score the held-out publications.
+    """
+    fold, train_index, test_index = args
+    contexts = _CV_STATE['contexts']
+    labels = _CV_STATE['labels']
+    top_k = _CV_STATE['top_k']
+
+    held_out = einb.count_learn([contexts[i] for i in test_index],
+                                [labels[i] for i in test_index])
+    counts = _CV_STATE['counts'] - held_out
+    # datasets in order of first appearance in the training publications,
+    # as `parameter_learn` would have seen them (ties in `predict`)
+    order = {}
+    for i in train_index:
+        for dataset in labels[i]:
+            order.setdefault(dataset, None)
+    dataset_word_dict, word_dataset_dict = counts.to_tables(order)
+
+    errs = []
+    precs = []
+    for i in test_index:
+        preds = [p[0] for p in einb.predict(contexts[i], dataset_word_dict,
+                                            word_dataset_dict, top_k)]
+        errs.append(top5UptoD_err(labels[i], preds))
+        precs.append(top5UptoD_prec(labels[i], preds))
+    return {'fold': fold, 'err': mean(errs), 'prec': mean(precs),
+            'errs': errs, 'precs': precs}
+
+
+def cross_validate(pub_contexts, pub_labels, n_splits=5, top_k=5,
+                   random_state=RAND_SEED, workers=None):
+    """ K-fold cross-validation of the einb baseline.
+        The counts of the whole corpus are computed once; the model of each
+        fold is obtained by subtracting the counts of its held-out
+        publications, which gives the same model (and metrics) as
+        retraining `parameter_learn` on the training publications.
+        Folds are those of KFold(n_splits, shuffle=True, random_state) and
+        are evaluated in parallel.
+        Input:
+            - pub_contexts: filtered sentences of each publication
+            - pub_labels: ground truth datasets of each publication
+        Output:
+            - per fold: mean top5UptoD error and precision, and the values
+              of every held-out publication
+    """
+    pub_contexts = list(pub_contexts)
+    pub_labels = list(pub_labels)
+    counts = einb.count_learn(pub_contexts, pub_labels)
+    kf = KFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+    folds = [(fold, train_index.tolist(), test_index.tolist())
+             for fold, (train_index, test_index)
+             in enumerate(kf.split(pub_contexts))]
+    workers = min(workers or os.cpu_count() or 1, n_splits)
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_init_cv_worker,
+                             initargs=(pub_contexts, pub_labels, counts,
+                                       top_k)) as executor:
+        return list(executor.map(_evaluate_fold, folds))
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import sqlite3
+import time
+
+from typing import Optional
+
+
+# bump when the filtering changes, to invalidate cached results
+FILTER_CACHE_TAG = b'final-approach-v1\n'
+MAX_BYTES = 1 << 30  # size bound of the cached windows
+EVICT_INTERVAL = 64  # writes between two evictions
+
+_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS results (
+        doc_hash TEXT NOT NULL,
+        patterns_hash TEXT NOT NULL,
+        windows TEXT NOT NULL,
+        candidates TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        last_used REAL NOT NULL,
+        PRIMARY KEY (doc_hash, patterns_hash)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)',
+    '''
+    CREATE TABLE IF NOT EXISTS pattern_lists (
+        patterns_hash TEXT PRIMARY KEY,
+        patterns TEXT NOT NULL
+    )
+    ''',
+]
+
+
+def doc_hash(context: str) -> str:
+    return hashlib.sha256(FILTER_CACHE_TAG +
+                          context.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+class FilterCache:
+    """ Persistent cache (sqlite) of the context windows of
+        `SentenceFilterClass.final_approach`, keyed by the hash of the
+        document text and the hash of the pattern lists.
+        The candidate patterns found in a document are stored with its
+        windows, and every pattern list is stored once, so that a result
+        can be carried over to an edited pattern list when the edit does
+        not touch the document (see `final_approach_cached`).
+        The total size of the cached windows is kept under `max_bytes` by
+        evicting the least recently used results. The database is in WAL
+        mode: several processes can share it, each with its own
+        FilterCache.
+    """
+
+    def __init__(self, filename: str, max_bytes: int = MAX_BYTES):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self._writes = 0
+        self._patterns = {}
+        self._conn = sqlite3.connect(filename, timeout=60)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        with self._conn:
+            for statement in _SCHEMA:
+                self._conn.execute(statement)
+
+    def close(self) -> None:
+        if self._writes:
+            self.evict()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self) -> int:
+        return self._conn.execute(
+            'SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def size(self) -> int:
+        return self._conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+
+    def get(self, doc_hash: str, patterns_hash: str) -> Optional[list]:
+        """ Cached windows of a document for a pattern list, or None.
+        """
+        row = self._conn.execute(
+            'SELECT windows FROM results '
+            'WHERE doc_hash = ? AND patterns_hash = ?',
+            (doc_hash, patterns_hash)).fetchone()
+        if row is None:
+            return None
+        with self._conn:
+            self._conn.execute(
+                'UPDATE results SET last_used = ? '
+                'WHERE doc_hash = ? AND patterns_hash = ?',
+                (time.time(), doc_hash, patterns_hash))
+        return json.loads(row[0])
+
+    def previous(self, doc_hash: str) -> Optional[tuple]:
+        """ Most recently used result of a document for any pattern list:
+            (patterns hash, windows, candidates), or None.
+        """
+        row = self._conn.execute(
+            'SELECT patterns_hash, windows, candidates FROM results '
+            'WHERE doc_hash = ? ORDER BY last_used DESC LIMIT 1',
+            (doc_hash,)).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1]), json.loads(row[2])
+
+    def put(self, doc_hash: str, patterns_hash: str, windows: list,
+            candidates: list) -> None:
+        data = json.dumps(windows)
+        with self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO results (doc_hash, patterns_hash, '
+                'windows, candidates, size, last_used) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (doc_hash, patterns_hash, data,
+                 json.dumps(sorted(set(candidates))), len(data),
+                 time.time()))
+        self._writes += 1
+        if self._writes % EVICT_INTERVAL == 0:
+            self.evict()
+
+    def add_patterns(self, patterns_hash: str, patterns: list) -> None:
+        """ Store a pattern list (once per hash).
+        """
+        if patterns_hash in self._patterns:
+            return
+        with self._conn:
+            self._conn.execute(
+                'INSERT OR IGNORE INTO pattern_lists (patterns_hash, '
+                'patterns) VALUES (?, ?)',
+                (patterns_hash, json.dumps(sorted(set(patterns)))))
+        self._patterns[patterns_hash] = frozenset(patterns)
+
+    def patterns(self, patterns_hash: str) -> Optional[frozenset]:
+        if patterns_hash not in self._patterns:
+            row = self._conn.execute(
+                'SELECT patterns FROM pattern_lists WHERE patterns_hash = ?',
+                (patterns_hash,)).fetchone()
+            if row is None:
+                return None
+            self._patterns[patterns_hash] = frozenset(json.loads(row[0]))
+        return self._patterns[patterns_hash]
+
+    def evict(self) -> None:
+        """ Drop the least recently used results beyond `max_bytes`.
+        """
+        with self._conn:
+            self._conn.execute(
+                'DELETE FROM results WHERE rowid IN ('
+                'SELECT rowid FROM (SELECT rowid, SUM(size) OVER '
+                '(ORDER BY last_used DESC, rowid DESC) AS total '
+                'FROM results) WHERE total > ?)',
+                (self.max_bytes,))
+            self._conn.execute(
+                'DELETE FROM pattern_lists WHERE patterns_hash NOT IN '
+                '(SELECT DISTINCT patterns_hash FROM results)')
+        self._patterns.clear()
@@ -0,0 +1,116 @@
+# Multi-pattern matcher used to detect candidate dataset mentions.
+import hashlib
+import re
+import lsarray1
+
+
+# characters accepted around a match by SentenceFilterClass.sep_checK
+SEP_CHECK_PUNC = lsarray1.SepCheckBoundary
+
+_END = None
+
+
+class PatternMatcher:
+    """ Precompiled matcher for a fixed list of patterns.
+
+        Patterns are stored in a character trie. A match can only start right
+        after a boundary character (or at the beginning of the text), so the
+        text is scanned once and the trie is walked from those positions
+        only. The boundary rules are the ones of `sep_checK`: a match is
+        accepted if it is preceded by a boundary character (or starts the
+        text) and followed by a boundary character, a digit, or the end of
+        the text.
+    """
+
+    def __init__(self, patterns, punc=SEP_CHECK_PUNC):
+        self.patterns = list(patterns)
+        self.punc = punc
+        self._digest = None
+        self._trie = {}
+        # sep_checK restarts its search one character after the previous
+        # occurrence and treats that position as the beginning of the
+        # text, which only matters for patterns made of a single repeated
+        # character. These few patterns are checked the original way.
+        self._repeated = set()
+        self._always = False
+        for pattern in set(self.patterns):
+            if pattern == '':
+                self._always = True
+            elif len(set(pattern)) == 1:
+                self._repeated.add(pattern)
+            else:
+                node = self._trie
+                for ch in pattern:
+                    node = node.setdefault(ch, {})
+                node[_END] = pattern
+        single = set(c for c in punc if len(c) == 1)
+        self._boundary = frozenset(single)
+        self._starts = re.compile(
+            '[' + ''.join(re.escape(c) for c in sorted(single)) + ']')
+
+    @property
+    def digest(self):
+        """ sha256 of the pattern list
+        """
+        if self._digest is None:
+            self._digest = hashlib.sha256(
+                '\n'.join(self.patterns).encode('utf-8')).hexdigest()
+        return self._digest
+
+    def _check_repeated(self, abb, cont):
+        # verbatim boundary logic of SentenceFilterClass.sep_checK
+        punc = self.punc
+        while abb in cont:
+            index = cont.find(abb)
+            lent = len(abb)
+            if cont[index+lent:index+lent+1] in punc or \
+                    cont[index+lent:index+lent+1].isdigit():
+                if index == 0:
+                    return True
+                elif cont[index-1:index] in punc:
+                    return True
+            elif index+lent == len(cont):
+                if index == 0:
+                    return True
+                elif cont[index-1:index] in punc:
+                    return True
+            cont = cont[index+1:]
+        return False
+
+    def matches(self, text):
+        """ Return the set of patterns occurring in `text` with valid
+            boundaries.
+        """
+        found = set()
+        if self._always:
+            found.add('')
+        trie = self._trie
+        boundary = self._boundary
+        n = len(text)
+
+        starts = [0]
+        starts.extend(m.end() for m in self._starts.finditer(text))
+        for i in starts:
+            node = trie
+            j = i
+            while j < n:
+                node = node.get(text[j])
+                if node is None:
+                    break
+                j += 1
+                pattern = node.get(_END)
+                if pattern is not None and pattern not in found:
+                    if j == n or text[j] in boundary or text[j].isdigit():
+                        found.add(pattern)
+
+        for pattern in self._repeated:
+            if self._check_repeated(pattern, text):
+                found.add(pattern)
+        return found
+
+    def candidates(self, text):
+        """ Return the patterns matched in `text`, in the order (and with the
+            multiplicity) of the pattern list.
+        """
+        found = self.matches(text)
+        return [p for p in self.patterns if p in found]
@@ -0,0 +1,218 @@
+import argparse
+import json
+import os
+import socketserver
+import threading
+
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import einb
+from sentence_filtering import (
+    SentenceFilterClass, _init_filter_worker, ABBS_PATH, PHRS_PATH)
+
+MODEL_PATH = '../data/einb_model/'
+HOST = '127.0.0.1'
+PORT = 8019
+TOP_K = 5
+MAX_WINDOWS = 3  # context windows returned per predicted dataset
+
+
+def _filter(text, path, ABBS_PATH, PHRS_PATH):
+    # run in a worker process, warmed up by _init_filter_worker
+    sent_filter = SentenceFilterClass()
+    if path is not None:
+        return sent_filter.final_approach_from_file(path, ABBS_PATH,
+                                                    PHRS_PATH)
+    return sent_filter.final_approach(text, ABBS_PATH, PHRS_PATH)
+
+
+def dataset_windows(model, row, windows, limit=MAX_WINDOWS):
+    """ The context windows contributing most to the score of dataset `row`
+        (sum over the window words of log_idf * log(count + 1)).
+    """
+    indptr = model.log_counts.indptr
+    start, end = indptr[row], indptr[row + 1]
+    weights = dict(zip(model.log_counts.indices[start:end].tolist(),
+                       model.log_counts.data[start:end].tolist()))
+    scored = []
+    for window in windows:
+        score = 0.
+        for w in window.split(' '):
+            i = model.word_idx.get(w)
+            if i is not None and i in weights:
+                score += model.log_idf[i] * weights[i]
+        if score > 0:
+            scored.append((score, window))
+    scored.sort(key=lambda sw: -sw[0])
+    return [window for _, window in scored[:limit]]
+
+
+class PredictionService:
+    """ Keeps the einb model in memory, and a pool of filter processes with
+        the pattern lists and the punkt model loaded.
+        `reload` loads a model next to the current one and swaps them once
+        it is ready; requests in flight finish with the model they started
+        with.
+    """
+
+    def __init__(self, model_path, workers=None,
+                 ABBS_PATH=ABBS_PATH, PHRS_PATH=PHRS_PATH):
+        self._reload_lock = threading.Lock()
+        self.ABBS_PATH, self.PHRS_PATH = ABBS_PATH, PHRS_PATH
+        self._state = self._load(model_path)
+        self.pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                                        initializer=_init_filter_worker,
+                                        initargs=(ABBS_PATH, PHRS_PATH))
+
+    def close(self):
+        self.pool.shutdown()
+
+    @staticmethod
+    def _load(model_path):
+        model = einb.load_model(model_path)
+        rows = {d: i for i, d in enumerate(model.datasets)}
+        return model_path, model, rows
+
+    def reload(self, model_path=None):
+        if model_path is not None and not isinstance(model_path, str):
+            raise ValueError(f'model must be a path, not {model_path!r}.')
+        with self._reload_lock:
+            state = self._load(model_path or self._state[0])
+            # a single assignment: readers see the old or the new state
+            self._state = state
+        return self.info()
+
+    def info(self):
+        model_path, model, _ = self._state
+        return {'model': model_path, 'datasets': len(model.datasets),
+                'words': len(model.words), 'vocab_hash': model.vocab_hash}
+
+    def predict(self, text=None, path=None, top_k=TOP_K):
+        if (text is None) == (path is None):
+            raise ValueError('Give either a text or a path.')
+        if not isinstance(text if path is None else path, str):
+            raise ValueError('text and path must be strings.')
+        if path is not None and not os.path.isfile(path):
+            raise ValueError(f'File {path} does not exist.')
+        if isinstance(top_k, bool) or not isinstance(top_k, int) \
+                or top_k < 1:
+            raise ValueError(f'top_k must be a positive integer, '
+                             f'not {top_k!r}.')
+        windows = self.pool.submit(_filter, text, path, self.ABBS_PATH,
+                                   self.PHRS_PATH).result()
+        _, model, rows = self._state
+        predictions = einb.sparse_predict(' '.join(windows), model, top_k)
+        return {
+            'predictions': [
+                {'dataset': dataset, 'score': score,
+                 'windows': dataset_windows(model, rows[dataset], windows)}
+                for dataset, score in predictions],
+            'windows': len(windows),
+        }
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    """ GET /health, POST /predict {"text" | "path", "top_k"},
+        POST /reload {"model"}
+    """
+
+    service = None
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        body = json.loads(self.rfile.read(length).decode('utf-8'))
+        if not isinstance(body, dict):
+            raise ValueError('The request body must be a json object.')
+        return body
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send(200, dict(status='ok', **self.service.info()))
+        else:
+            self._send(404, {'error': f'Unknown endpoint {self.path}'})
+
+    def do_POST(self):
+        try:
+            body = self._body()
+            if self.path == '/predict':
+                result = self.service.predict(
+                    body.get('text'), body.get('path'),
+                    body.get('top_k', TOP_K))
+            elif self.path == '/reload':
+                result = dict(status='reloaded',
+                              **self.service.reload(body.get('model')))
+            else:
+                self._send(404, {'error': f'Unknown endpoint {self.path}'})
+                return
+        except ValueError as err:
+            self._send(400, {'error': str(err)})
+            return
+        except Exception as err:
+            # answer instead of dropping the connection
+            self.log_error('%s failed: %r', self.path, err)
+            self._send(500, {'error': f'Internal error: {err!r}'})
+            return
+        self._send(200, result)
+
+    def address_string(self):
+        # unix socket clients have no address
+        return str(self.client_address[0]) if self.client_address else '-'
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn,
+                              socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(service, host=HOST, port=PORT, socket_path=None):
+    handler = type('Handler', (PredictionHandler,), {'service': service})
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = ThreadingUnixHTTPServer(socket_path, handler)
+        print(f'Serving on {socket_path}')
+    else:
+        server = ThreadingHTTPServer((host, port), handler)
+        print(f'Serving on http://{host}:{port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve einb predictions \
+                                     of publications over http')
+    parser.add_argument('--model', type=str,
+                        default=MODEL_PATH,
+                        help='Model folder written by einb.save_model')
+    parser.add_argument('--host', type=str,
+                        default=HOST,
+                        help='Address to listen on')
+    parser.add_argument('--port', type=int,
+                        default=PORT,
+                        help='Port to listen on')
+    parser.add_argument('--socket', type=str,
+                        default=None,
+                        help='Listen on this unix socket instead')
+    parser.add_argument('--workers', type=int,
+                        default=None,
+                        help='Number of filter processes \
+                        (default: number of cpus)')
+    args = parser.parse_args()
+    serve(PredictionService(args.model, args.workers),
+          args.host, args.port, args.socket)
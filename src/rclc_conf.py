@@ -5,4 +5,5 @@ RAND_SEED = 2019
 # Corpus configuration
 CORPUS_FILE = '../data/corpus.jsonld'
 CACHE_PUB_FILE = 'pub_cache.json'
+CACHE_PACK_FILE = 'pub_cache.pack'
 
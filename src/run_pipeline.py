@@ -0,0 +1,463 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import time
+import traceback
+
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from tqdm import tqdm  # type: ignore
+from urllib.parse import urlparse
+
+import einb
+from data_utils import (
+    build_corpus_cache, convert_pdf2text, download_resources, iter_corpus,
+    load_corpus, load_rcc_cache_dataset, read_pub_text, _parse_cache_path,
+    DATASET_PAGE_PATH, MANIFEST_FILE, MAX_WORKERS, PUB_PDF_PATH,
+    PUB_TXT_PATH)
+from download_manifest import DownloadManifest, STATUS_FAILED
+from eval_utils import cross_validate
+from rclc_conf import CACHE_PACK_FILE, CORPUS_FILE
+from sentence_filtering import (
+    filter_context, _init_filter_worker, ABBS_PATH, PHRS_PATH)
+from corpus_cache import INDEX_SUFFIX
+
+DATA_FOLDER = '../data/'
+PARSED_PUB_PATH = 'resource/pubs/json/'
+CONTEXTS_FILE = 'pub_contexts.jsonl'
+FILTER_CACHE_FILE = 'filter_cache.sqlite'
+MODEL_PATH = 'einb_model/'
+COUNTS_FILE = 'einb_counts.json'
+CV_FILE = 'cv_results.json'
+REPORT_FILE = 'pipeline_report.json'
+
+PUB_FIELDS = ['@id', 'dct:title', 'dct:publisher', 'parsed_pub',
+              'cito:citesAsDataSource']
+
+
+def _entity_id(entity):
+    return urlparse(entity['@id']).fragment.split('-')[1]
+
+
+def _mtime(path):
+    """ Modification time of a file, or of the newest file of a folder;
+        None if missing (or empty).
+    """
+    if os.path.isfile(path):
+        return os.stat(path).st_mtime
+    if os.path.isdir(path):
+        times = [f.stat().st_mtime for f in os.scandir(path) if f.is_file()]
+        return max(times) if times else None
+    return None
+
+
+def _usage():
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        'cpu_self': self_usage.ru_utime + self_usage.ru_stime,
+        'cpu_children': children.ru_utime + children.ru_stime,
+        # kilobytes on linux
+        'maxrss_self': self_usage.ru_maxrss,
+        'maxrss_children': children.ru_maxrss,
+    }
+
+
+def _run_stage(run, conn):
+    # body of the process running a stage
+    try:
+        before = _usage()
+        counters = run() or {}
+        conn.send(('done', counters, before, _usage()))
+    except BaseException as err:
+        try:
+            conn.send(('failed', err, None, None))
+        except Exception:
+            conn.send(('failed', RuntimeError(traceback.format_exc()),
+                       None, None))
+    finally:
+        conn.close()
+
+
+class Stage:
+    """ One step of the pipeline. The stage is up to date when all its
+        outputs exist and are newer than all its inputs, and `pending`
+        (if given) reports no work left; `run` returns the stage counters
+        ({'items': .., 'cache_hits': .., ...}). Cache hits are counted per
+        item, unless `cache_lookups` says otherwise.
+        A stage runs in a forked process of its own, so that the cpu time
+        and peak memory of the report are those of the stage only.
+    """
+
+    def __init__(self, name, inputs, outputs, run, pending=None):
+        self.name = name
+        self.inputs = inputs
+        self.outputs = outputs
+        self.run = run
+        self.pending = pending
+
+    def up_to_date(self):
+        out_times = [_mtime(p) for p in self.outputs]
+        if not out_times or None in out_times:
+            return False
+        if self.pending is not None and self.pending():
+            return False
+        in_times = [t for t in (_mtime(p) for p in self.inputs)
+                    if t is not None]
+        return not in_times or min(out_times) >= max(in_times)
+
+    def _run_forked(self):
+        context = multiprocessing.get_context('fork')
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=_run_stage, args=(self.run, sender))
+        process.start()
+        sender.close()
+        try:
+            status, counters, before, after = receiver.recv()
+        except EOFError:
+            status = None
+        process.join()
+        if status is None:
+            raise RuntimeError(f'Stage {self.name} died with exit code '
+                               f'{process.exitcode}')
+        if status == 'failed':
+            raise counters
+        return counters, before, after
+
+    def execute(self, force=False):
+        """ Run the stage (unless up to date) and return its report.
+        """
+        report = {'stage': self.name, 'inputs': self.inputs,
+                  'outputs': self.outputs}
+        if not force and self.up_to_date():
+            report['status'] = 'skipped'
+            return report
+
+        start = time.perf_counter()
+        counters, before, after = self._run_forked()
+        wall = time.perf_counter() - start
+
+        report['status'] = 'done'
+        report['wall_time'] = wall
+        report['cpu_time'] = {
+            'self': after['cpu_self'] - before['cpu_self'],
+            'children': after['cpu_children'] - before['cpu_children'],
+        }
+        # peak resident set size of the stage process (which starts as a
+        # fork of the small driver process) and of its largest worker
+        report['peak_rss_kb'] = {
+            'self': after['maxrss_self'],
+            'children': after['maxrss_children'],
+        }
+        report.update(counters)
+        lookups = counters.get('cache_lookups', counters.get('items'))
+        if 'cache_hits' in counters and lookups:
+            report['cache_hit_rate'] = counters['cache_hits'] / lookups
+        return report
+
+
+def _download_stage(corpus_file, data_folder, workers):
+    def run():
+        corpus = load_corpus(corpus_file)
+        manifest_file = data_folder + MANIFEST_FILE
+        ok = set()
+        if os.path.isfile(manifest_file):
+            manifest = DownloadManifest(manifest_file)
+            ok = set(key for key, entry in manifest.entries().items()
+                     if entry['status'] != STATUS_FAILED)
+            manifest.close()
+        download_resources(corpus, data_folder, workers=workers)
+        manifest = DownloadManifest(manifest_file)
+        downloaded = set(key for key, entry in manifest.entries().items()
+                         if entry['status'] != STATUS_FAILED)
+        manifest.close()
+        keys = set((e['@type'], _entity_id(e)) for e in corpus)
+        return {'items': len(keys),
+                'cache_hits': len(keys & ok),
+                'failed': len(keys - downloaded)}
+    return run
+
+
+def _failed_downloads(manifest_file):
+    # the download stage reruns while the manifest has failed entries
+    def pending():
+        if not os.path.isfile(manifest_file):
+            return False
+        manifest = DownloadManifest(manifest_file)
+        failed = manifest.entries(STATUS_FAILED)
+        manifest.close()
+        return len(failed) > 0
+    return pending
+
+
+def _pdf2text_stage(pdf_path, text_path, manifest_file, workers):
+    def run():
+        os.makedirs(text_path, exist_ok=True)
+        pdfs = list(Path(pdf_path).glob('*.pdf'))
+        hits = 0
+        for pdf in pdfs:
+            txt_time = _mtime(text_path + pdf.name + '.txt')
+            if txt_time is not None and txt_time >= pdf.stat().st_mtime:
+                hits += 1
+        convert_pdf2text(pdf_path, text_path, workers=workers,
+                         manifest_file=manifest_file)
+        converted = sum(1 for pdf in pdfs
+                        if os.path.isfile(text_path + pdf.name + '.txt'))
+        return {'items': len(pdfs), 'cache_hits': hits,
+                'failed': len(pdfs) - converted}
+    return run
+
+
+def _parsed_pubs_stage(corpus_file, parsed_pub_path):
+    # science-parse runs outside of this pipeline; only check its output
+    def run():
+        pubs = [e for e in iter_corpus(corpus_file)
+                if e['@type'] == 'ResearchPublication']
+        missing = [_entity_id(p) for p in pubs if not os.path.isfile(
+            parsed_pub_path + _entity_id(p) + '.pdf.json')]
+        if missing:
+            raise ValueError(f'{len(missing)} publications were not parsed '
+                             f'by science-parse yet (into '
+                             f'{parsed_pub_path}), e.g. {missing[:5]}')
+        return {'items': len(pubs)}
+    return run
+
+
+def _corpus_stage(corpus_file, html_path, parsed_pub_path, cache_file,
+                  workers):
+    def run():
+        cache_path = _parse_cache_path(html_path)
+        before = len(os.listdir(cache_path)) \
+            if os.path.isdir(cache_path) else 0
+        counts = build_corpus_cache(corpus_file, html_path, parsed_pub_path,
+                                    cache_file, workers)
+        parsed = len(os.listdir(cache_path)) - before
+        pages = len(set(str(p) for p in Path(html_path).glob('*.html')))
+        return {'items': counts['pubs'] + counts['datasets'],
+                'pubs': counts['pubs'],
+                'datasets': counts['datasets'],
+                'cache_lookups': pages,
+                'cache_hits': max(pages - parsed, 0)}
+    return run
+
+
+def pub_context(pub, text_path):
+    """ Text of a publication used for training (as in the baseline
+        notebook): title, publisher, abstract, sections (or the pdftotext
+        text when science-parse found none) and reference titles.
+        Differences with the notebook:
+            - the pdftotext text is added as one string; the notebook
+              extends the context with its characters, which are then
+              joined with spaces
+            - reference titles that are None are skipped; the notebook's
+              join fails on them
+            - a publication without references adds no titles; the
+              notebook adds those of the previous publication again
+    """
+    context = [pub['dct:title']['@value'], pub['dct:publisher']['@value']]
+    metadata = pub['parsed_pub']['metadata']
+    if metadata['abstractText']:
+        context.append(metadata['abstractText'])
+    if metadata['sections']:
+        context.extend(sec['text'] for sec in metadata['sections']
+                       if len(sec['text']) > 0)
+    else:
+        context.append(read_pub_text(text_path + _entity_id(pub) +
+                                     '.pdf.txt'))
+    if metadata['references']:
+        context.extend(ref['title'] for ref in metadata['references']
+                       if ref['title'])
+    return ' '.join(context)
+
+
+def pub_label(pub):
+    citations = pub['cito:citesAsDataSource']
+    if isinstance(citations, list):
+        return [c['@id'] for c in citations]
+    return [citations['@id']]
+
+
+def _filter_stage(data_folder, text_path, out_file, cache_file, workers):
+    def run():
+        corpus = load_rcc_cache_dataset(data_folder, PUB_FIELDS)
+        pubs = corpus['pubs']
+        contexts = [pub_context(pub, text_path) for pub in pubs]
+        statuses = Counter()
+        with open(out_file + '.part', 'w', encoding='utf-8') as out, \
+                ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                                    initializer=_init_filter_worker,
+                                    initargs=(ABBS_PATH, PHRS_PATH,
+                                              cache_file)) as executor:
+            filtered = executor.map(filter_context, contexts, chunksize=8)
+            for pub, (textlist, status) in tqdm(zip(pubs, filtered),
+                                                total=len(pubs), ascii=True,
+                                                desc='filter sentences'):
+                statuses[status] += 1
+                out.write(json.dumps({'id': pub['@id'],
+                                      'context': ' '.join(textlist),
+                                      'labels': pub_label(pub)}) + '\n')
+        os.replace(out_file + '.part', out_file)
+        return {'items': len(pubs),
+                'characters': sum(len(c) for c in contexts),
+                'cache_hits': statuses['hit'] + statuses['reused'],
+                'cache_reused': statuses['reused']}
+    return run
+
+
+def read_contexts(contexts_file):
+    """ (ids, filtered contexts, labels) written by the filter stage
+    """
+    ids, contexts, labels = [], [], []
+    with open(contexts_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            ids.append(record['id'])
+            contexts.append(record['context'])
+            labels.append(record['labels'])
+    return ids, contexts, labels
+
+
+def _train_stage(contexts_file, counts_file, model_path, workers):
+    def run():
+        _, contexts, labels = read_contexts(contexts_file)
+        counts = einb.parallel_count_learn(contexts, labels, workers)
+        einb.save_counts(counts, counts_file)
+        model = counts.to_sparse_model()
+        einb.save_model(model, model_path)
+        return {'items': len(contexts),
+                'datasets': len(model.datasets),
+                'words': len(model.words)}
+    return run
+
+
+def _evaluate_stage(contexts_file, out_file, n_splits, workers):
+    def run():
+        _, contexts, labels = read_contexts(contexts_file)
+        folds = cross_validate(contexts, labels, n_splits=n_splits,
+                               workers=workers)
+        results = {'folds': [{'fold': r['fold'], 'err': r['err'],
+                              'prec': r['prec']} for r in folds]}
+        results['err'] = sum(r['err'] for r in folds) / len(folds)
+        results['prec'] = sum(r['prec'] for r in folds) / len(folds)
+        with open(out_file, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Average top5UptoD error rate: {results["err"]}')
+        return {'items': len(contexts), 'err': results['err'],
+                'prec': results['prec']}
+    return run
+
+
+def build_stages(args):
+    data = args.data_folder
+    corpus_file = args.corpus
+    pdf_path = data + PUB_PDF_PATH
+    text_path = data + PUB_TXT_PATH
+    html_path = data + DATASET_PAGE_PATH
+    parsed_pub_path = data + PARSED_PUB_PATH
+    manifest_file = data + MANIFEST_FILE
+    pack_index = data + CACHE_PACK_FILE + INDEX_SUFFIX
+    contexts_file = data + CONTEXTS_FILE
+    counts_file = data + COUNTS_FILE
+    model_path = data + MODEL_PATH
+    cv_file = data + CV_FILE
+    return [
+        Stage('download', [corpus_file], [manifest_file],
+              _download_stage(corpus_file, data, args.download_workers),
+              pending=_failed_downloads(manifest_file)),
+        Stage('pdf2text', [pdf_path], [text_path],
+              _pdf2text_stage(pdf_path, text_path, manifest_file,
+                              args.workers)),
+        Stage('science-parse', [corpus_file, pdf_path], [parsed_pub_path],
+              _parsed_pubs_stage(corpus_file, parsed_pub_path)),
+        Stage('corpus', [corpus_file, html_path, parsed_pub_path],
+              [pack_index],
+              _corpus_stage(corpus_file, html_path, parsed_pub_path,
+                            data + CACHE_PACK_FILE, args.workers)),
+        Stage('filter', [pack_index, text_path, ABBS_PATH, PHRS_PATH],
+              [contexts_file],
+              _filter_stage(data, text_path, contexts_file,
+                            data + FILTER_CACHE_FILE, args.workers)),
+        Stage('train', [contexts_file],
+              [counts_file, os.path.join(model_path, 'header.json')],
+              _train_stage(contexts_file, counts_file, model_path,
+                           args.workers)),
+        Stage('evaluate', [contexts_file], [cv_file],
+              _evaluate_stage(contexts_file, cv_file, args.folds,
+                              args.workers)),
+    ]
+
+
+def main(args):
+    stages = build_stages(args)
+    names = [stage.name for stage in stages]
+    selected = args.stages or names
+    for name in selected:
+        if name not in names:
+            raise ValueError(f'Unknown stage: {name} (stages: {names})')
+
+    report = {
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'host': {'platform': platform.platform(),
+                 'python': platform.python_version(),
+                 'cpus': os.cpu_count()},
+        'args': vars(args),
+        'stages': [],
+    }
+    start = time.perf_counter()
+    try:
+        for stage in stages:
+            if stage.name not in selected:
+                continue
+            print(f'== {stage.name}')
+            try:
+                stage_report = stage.execute(force=args.force)
+            except Exception as err:
+                report['stages'].append({'stage': stage.name,
+                                         'status': 'failed',
+                                         'error': str(err)})
+                raise
+            report['stages'].append(stage_report)
+            if stage_report['status'] == 'skipped':
+                print(f'{stage.name}: up to date')
+            else:
+                print(f'{stage.name}: {stage_report["wall_time"]:.1f}s')
+    finally:
+        report['wall_time'] = time.perf_counter() - start
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the rclc baseline \
+                                     pipeline: download, pdf2text, \
+                                     science-parse check, corpus, filter, \
+                                     train, evaluate')
+    parser.add_argument('--corpus', type=str,
+                        default=CORPUS_FILE,
+                        help='rclc corpus file')
+    parser.add_argument('--data_folder', type=str,
+                        default=DATA_FOLDER,
+                        help='Folder of the resources and of the outputs')
+    parser.add_argument('--stages', type=str, nargs='+',
+                        default=None,
+                        help='Stages to run (default: all)')
+    parser.add_argument('--force', action='store_true',
+                        help='Run the stages even if up to date')
+    parser.add_argument('--workers', type=int,
+                        default=None,
+                        help='Number of processes (default: number of cpus)')
+    parser.add_argument('--download_workers', type=int,
+                        default=MAX_WORKERS,
+                        help='Number of concurrent downloads')
+    parser.add_argument('--folds', type=int,
+                        default=5,
+                        help='Number of cross-validation folds')
+    parser.add_argument('--report', type=str,
+                        default=DATA_FOLDER + REPORT_FILE,
+                        help='Json file receiving the run report')
+    args = parser.parse_args()
+    main(args)
@@ -1,20 +1,52 @@
-from nltk.tokenize import sent_tokenize
 import lsarray1
 import aux_functions as aux_fun
+import filter_cache
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from pattern_matcher import PatternMatcher
+from text_utils import punkt_tokenizer, read_text
+from tqdm import tqdm
 auxfun=aux_fun.AuxFunClass
+import argparse
+import bisect
 import os
 import json
+import re
 
 RESOURCE_PATH = '../resources/'
 ABBS_PATH = RESOURCE_PATH + 'listofabb_dataset.txt'
 PHRS_PATH = RESOURCE_PATH + 'listofPhrase_dataset.txt'
+# characters tokenized on each side of a pattern hit, doubled until the
+# sentences of the hits are found
+PREFILTER_MARGIN = 200
+
+# matchers built from the pattern files, keyed by path and modification time
+_MATCHERS = {}
+# pattern list edits since a cached result, see _pattern_edit
+_PATTERN_EDITS = {}
+# FilterCache of a filter worker process
+_FILTER_CACHE = None
+
+_WORD = re.compile(r'\S+')
+
+
+def load_matcher(ABBS_PATH=ABBS_PATH, PHRS_PATH=PHRS_PATH):
+    key = (ABBS_PATH, os.path.getmtime(ABBS_PATH),
+           PHRS_PATH, os.path.getmtime(PHRS_PATH))
+    if key not in _MATCHERS:
+        abb1 = auxfun.readtoarr2(auxfun, ABBS_PATH)
+        abb2 = auxfun.readtoarr2(auxfun, PHRS_PATH)
+        _MATCHERS.clear()
+        _MATCHERS[key] = PatternMatcher(abb1 + abb2)
+    return _MATCHERS[key]
 
 class SentenceFilterClass:
 
 
     # This function checks if a special feature exists in a context.
     def sep_checK(self,abb,cont):
-            punc= lsarray1.Punctuation + lsarray1.Punctuation1 + lsarray1.Punctuation2 + [' '] + ['s']
+            punc= lsarray1.SepCheckBoundary
             while abb in cont:
                     index=cont.find(abb)
                     lent=len(abb)
@@ -36,28 +68,50 @@ class SentenceFilterClass:
             return False
 
     # read papers
-    def read_context(self, filename):
-        f = open(filename, 'r', encoding='utf-8')
-
-        content = ''
-        for line in f:
-            content = content + line.rstrip('\n') + ' '
-        return content[:-1]
+    def read_context(self, filename, use_mmap=False):
+        return read_text(filename, use_mmap)
 
 
     def final_approach(self, context, ABBS_PATH = ABBS_PATH, PHRS_PATH = PHRS_PATH):
-        ls = sent_tokenize(context)
+        # same candidates as calling sep_checK for every pattern, in one scan
+        candidate = load_matcher(ABBS_PATH, PHRS_PATH).candidates(context)
+        return self.hit_windows(context, candidate)
+
+    # same windows as candidate_windows, but only the sentences holding an
+    # occurrence of a candidate are tokenized, and the sepfinder and
+    # sep_checK rules are applied to the patterns found in each of them
+    # instead of to every candidate and sentence
+    def hit_windows(self, context, candidate):
+        hits = _pattern_hits(context, candidate)
+        spans, _ = _hit_sentences(context, hits)
 
-        abb1= auxfun.readtoarr2(auxfun,ABBS_PATH)
-        abb2= auxfun.readtoarr2(auxfun, PHRS_PATH)
+        patterns_of = {}
+        for (start, end), patterns in spans.items():
+            patterns_of.setdefault(context[start:end], set()).update(patterns)
+        matched = {}
+        abbinT = set()
+        for sentence, patterns in patterns_of.items():
+            textlist, abbinTlist = auxfun.sepfinder(auxfun, patterns,
+                                                    [sentence])
+            if textlist:
+                matched[sentence] = patterns
+                abbinT.update(abbinTlist)
 
-        candidate=[]
-        for item in abb1:
-            if self.sep_checK(item,context):
-                candidate.append(item)
-        for item in abb2:
-            if self.sep_checK(item,context):
-                candidate.append(item)
+        lsallsplit = set()
+        for itemsenasquery, patterns in matched.items():
+            query_proc = None
+            for itemabb_q in patterns & abbinT:
+                if self.sep_checK(itemabb_q, itemsenasquery):
+                    if query_proc is None:
+                        query_proc = auxfun.rmovepu(auxfun, itemsenasquery)
+                    lsallsplit.update(auxfun.querysplitter(
+                        auxfun, itemsenasquery, itemabb_q, query_proc))
+        return list(lsallsplit)
+
+    # context windows of the candidate patterns found in a context, with
+    # the whole context tokenized (reference of hit_windows)
+    def candidate_windows(self, context, candidate):
+        ls = punkt_tokenizer().tokenize(context)
 
         #find whether there are exact macthes
         #return sentencesa and features
@@ -66,23 +120,274 @@ class SentenceFilterClass:
         abbinTlist1=list(set(abbinTlist))
         textlist1=list(set(textlist))
 
-        lsallsplit=[]
+        # rmovepu runs at most once per sentence
+        query_procs = {}
+        lsallsplit = set()
         for itemabb_q in abbinTlist1:
            for itemsenasquery in textlist1:
                 if self.sep_checK(itemabb_q,itemsenasquery):
-                    neulistofquery= auxfun.querysplitter(auxfun, itemsenasquery, itemabb_q)
-                    lsallsplit=lsallsplit+neulistofquery
-        textlist1=list(set(lsallsplit))
+                    if itemsenasquery not in query_procs:
+                        query_procs[itemsenasquery] = auxfun.rmovepu(
+                            auxfun, itemsenasquery)
+                    neulistofquery= auxfun.querysplitter(
+                        auxfun, itemsenasquery, itemabb_q,
+                        query_procs[itemsenasquery])
+                    lsallsplit.update(neulistofquery)
+        textlist1=list(lsallsplit)
 
         return textlist1
 
+    # final_approach through a FilterCache; also tells whether the result
+    # was cached ('hit'), carried over from another version of the pattern
+    # lists ('reused') or computed
+    def final_approach_cached(self, context, cache,
+                              ABBS_PATH=ABBS_PATH, PHRS_PATH=PHRS_PATH):
+        matcher = load_matcher(ABBS_PATH, PHRS_PATH)
+        key = filter_cache.doc_hash(context)
+        textlist = cache.get(key, matcher.digest)
+        if textlist is not None:
+            return textlist, 'hit'
+
+        cache.add_patterns(matcher.digest, matcher.patterns)
+        previous = cache.previous(key)
+        if previous is not None:
+            patterns_hash, textlist, candidate = previous
+            old_patterns = cache.patterns(patterns_hash)
+            if old_patterns is not None:
+                # the result only changes if a removed pattern was a
+                # candidate or an added pattern occurs in the context
+                removed, added = _pattern_edit(patterns_hash, old_patterns,
+                                               matcher)
+                if removed.isdisjoint(candidate) and \
+                        not added.matches(context):
+                    cache.put(key, matcher.digest, textlist, candidate)
+                    return textlist, 'reused'
+
+        candidate = matcher.candidates(context)
+        textlist = self.hit_windows(context, candidate)
+        cache.put(key, matcher.digest, textlist, candidate)
+        return textlist, 'computed'
+
     def final_approach_from_file(self, filename,
                                  ABBS_PATH=ABBS_PATH, PHRS_PATH=PHRS_PATH):
         context = self.read_context(filename)
-        return self.final_approach(context)
+        return self.final_approach(context, ABBS_PATH, PHRS_PATH)
+
+
+def _pattern_hits(context, candidate):
+    """ (start, end, pattern) of every occurrence of the candidates in a
+        context, overlapping ones included, sorted by start
+    """
+    hits = []
+    for pattern in set(candidate):
+        i = context.find(pattern)
+        while i != -1:
+            hits.append((i, i + len(pattern), pattern))
+            i = context.find(pattern, i + 1)
+    hits.sort()
+    return hits
+
+
+def _trusted_bounds(context, lo, hi):
+    # punkt decides a sentence break from the word holding the period and
+    # the next one, so the breaks of context[lo:hi] are those of the whole
+    # context except near a cut edge: only sentences starting from the
+    # fourth word and ending before the third last word are kept
+    words = [m.start() for m in _WORD.finditer(context, lo, hi)]
+    start = lo if lo == 0 else (words[3] if len(words) > 3 else hi)
+    end = hi if hi == len(context) else (words[-3] if len(words) > 2 else lo)
+    return start, end
+
+
+def _locate(hits, spans, lo, start, end):
+    # sentence span of every hit inside a sentence, or None if a hit is in
+    # a sentence cut by the window
+    starts = [s for s, _ in spans]
+    located = []
+    for i, j, pattern in hits:
+        k = bisect.bisect_right(starts, i) - 1
+        if k < 0:
+            # before the first sentence: leading blanks of the context
+            if lo > 0:
+                return None
+            continue
+        s, e = spans[k]
+        if s < start or e > end:
+            return None
+        if j <= e:
+            located.append(((s, e), pattern))
+    return located
+
+
+def _hit_sentences(context, hits, margin=PREFILTER_MARGIN):
+    """ The sentences of a context (punkt) holding the hits of
+        `_pattern_hits`, found by tokenizing windows around the hits; the
+        window of a hit in a sentence reaching a cut edge is widened.
+        Returns {(start, end): [patterns]} and the number of sentences
+        tokenized.
+    """
+    tokenizer = punkt_tokenizer()
+    n = len(context)
+    sentences = {}
+    tokenized = 0
+    k = 0
+    while k < len(hits):
+        pad = margin
+        while True:
+            # hits closer than 2 * pad share a window
+            lo = max(0, hits[k][0] - pad)
+            hi = min(n, hits[k][1] + pad)
+            m = k + 1
+            while m < len(hits) and hits[m][0] - pad < hi:
+                hi = max(hi, min(n, hits[m][1] + pad))
+                m += 1
+            spans = [(lo + s, lo + e)
+                     for s, e in tokenizer.span_tokenize(context[lo:hi])]
+            tokenized += len(spans)
+            start, end = _trusted_bounds(context, lo, hi)
+            located = _locate(hits[k:m], spans, lo, start, end)
+            if located is not None:
+                break
+            pad *= 2
+        for span, pattern in located:
+            sentences.setdefault(span, []).append(pattern)
+        k = m
+    return sentences, tokenized
+
+
+def _pattern_edit(old_hash, old_patterns, matcher):
+    # patterns removed from, and matcher of the patterns added to, an older
+    # version of the pattern lists
+    key = (old_hash, matcher.digest)
+    if key not in _PATTERN_EDITS:
+        new_patterns = frozenset(matcher.patterns)
+        _PATTERN_EDITS.clear()
+        _PATTERN_EDITS[key] = (old_patterns - new_patterns, PatternMatcher(
+            sorted(new_patterns - old_patterns)))
+    return _PATTERN_EDITS[key]
+
+
+def _init_filter_worker(ABBS_PATH, PHRS_PATH, cache_file=None):
+    # load the pattern lists and the punkt model once per worker
+    global _FILTER_CACHE
+    load_matcher(ABBS_PATH, PHRS_PATH)
+    punkt_tokenizer()
+    if cache_file:
+        # every write is committed; evictions run every EVICT_INTERVAL writes
+        _FILTER_CACHE = filter_cache.FilterCache(cache_file)
+
+
+def filter_context(context, ABBS_PATH=ABBS_PATH, PHRS_PATH=PHRS_PATH):
+    """ final_approach of a context, through the filter cache of the worker
+        if it has one; returns the windows and the cache status
+    """
+    sent_filter = SentenceFilterClass()
+    if _FILTER_CACHE is None:
+        return sent_filter.final_approach(context, ABBS_PATH, PHRS_PATH), None
+    return sent_filter.final_approach_cached(context, _FILTER_CACHE,
+                                             ABBS_PATH, PHRS_PATH)
+
+
+def _filter_file(filename, ABBS_PATH, PHRS_PATH):
+    context = SentenceFilterClass().read_context(filename)
+    textlist, _ = filter_context(context, ABBS_PATH, PHRS_PATH)
+    return Path(filename).name, textlist
+
+
+def _completed_files(out_path):
+    """ names of the files already in the output, and of those among them
+        that failed; a partly written last line (killed run) is cut off
+    """
+    done = set()
+    failed = set()
+    if not os.path.isfile(out_path):
+        return done, failed
+    with open(out_path, 'rb+') as f:
+        data = f.read()
+        end = data.rfind(b'\n') + 1
+        if end < len(data):
+            f.truncate(end)
+    for line in data[:end].decode('utf-8').splitlines():
+        if line:
+            record = json.loads(line)
+            done.add(record['file'])
+            # a later line of the same file (retry) wins
+            if 'error' in record:
+                failed.add(record['file'])
+            else:
+                failed.discard(record['file'])
+    return done, failed
+
+
+def filter_corpus(text_dir, out_path, workers=None,
+                  ABBS_PATH=ABBS_PATH, PHRS_PATH=PHRS_PATH,
+                  pattern='*.txt', cache_file=None, retry_failed=False):
+    """ Run final_approach_from_file on every file of text_dir matching
+        pattern, spread over `workers` processes (default: one per cpu).
+        Every result is appended to out_path (json lines,
+        {"file": <file name>, "filtered": <filtered sentences>}) as soon as
+        the file is done; files already in out_path are skipped, so a
+        killed run resumes where it stopped.
+        A file whose filtering raises is recorded as
+        {"file": <file name>, "error": <message>} and the run goes on;
+        failed files are skipped on resume unless `retry_failed`.
+        With `cache_file`, results go through a shared FilterCache.
+        Returns the number of files processed and the number that failed.
+    """
+    done, failed = _completed_files(out_path)
+    if retry_failed:
+        done -= failed
+    files = sorted(str(f) for f in Path(text_dir).glob(pattern)
+                   if f.name not in done)
+
+    errors = 0
+    with open(out_path, 'a', encoding='utf-8') as out, \
+            ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                                initializer=_init_filter_worker,
+                                initargs=(ABBS_PATH, PHRS_PATH,
+                                          cache_file)) as executor:
+        futures = {executor.submit(_filter_file, f, ABBS_PATH, PHRS_PATH): f
+                   for f in files}
+        for future in tqdm(as_completed(futures), total=len(futures),
+                           ascii=True, desc='filter sentences'):
+            name = Path(futures[future]).name
+            try:
+                _, textlist = future.result()
+                record = {'file': name, 'filtered': textlist}
+            except BrokenProcessPool:
+                # not the fault of the file: stop, the run can be resumed
+                raise
+            except Exception as err:
+                print(f'Failed filtering {name}: {err!r}')
+                record = {'file': name, 'error': repr(err)}
+                errors += 1
+            out.write(json.dumps(record) + '\n')
+            out.flush()
+    return len(files), errors
 
 
 if __name__ == '__main__':
-    ma = sentence_filter_class()
-    textlist = ma.final_approach_from_file('test_data/files/text/143.txt')
-    print(textlist)
+    parser = argparse.ArgumentParser(description='Filter the sentences of \
+                                     all text files in a folder')
+    parser.add_argument('--text_dir', type=str,
+                        default='../data/resource/pubs/text/',
+                        help='Folder containing publication text files')
+    parser.add_argument('--output', type=str,
+                        default='../data/filtered_sentences.jsonl',
+                        help='Json lines file receiving the filtered \
+                        sentences')
+    parser.add_argument('--workers', type=int,
+                        default=None,
+                        help='Number of processes (default: number of cpus)')
+    parser.add_argument('--cache', type=str,
+                        default=None,
+                        help='Filter cache file (sqlite), shared by runs')
+    parser.add_argument('--retry_failed', action='store_true',
+                        help='Filter again the files that failed in a \
+                        previous run')
+    args = parser.parse_args()
+    n_files, n_failed = filter_corpus(args.text_dir, args.output,
+                                      args.workers, cache_file=args.cache,
+                                      retry_failed=args.retry_failed)
+    if n_failed:
+        print(f'{n_failed} of {n_files} files failed, see {args.output}')
@@ -0,0 +1,22 @@
+import json
+
+import pytest
+
+import data_utils
+
+
+GRAPH = [
+    {'@id': 'https://x/#dataset-1', '@type': 'Dataset', 'size': 12.75,
+     'years': [1999, 2001], 'weight': -3e-2, 'flag': True, 'note': None},
+    {'@id': 'https://x/#publication-1', '@type': 'ResearchPublication',
+     'score': 1E+3, 'pages': 10, 'ratio': 0.5},
+]
+
+
+@pytest.mark.parametrize('chunk_size', range(1, 40))
+def test_iter_corpus_numbers_across_chunks(tmp_path, chunk_size):
+    corpus_file = tmp_path / 'corpus.jsonld'
+    corpus_file.write_text(json.dumps(
+        {'@context': 2.5, 'n': 1000, '@graph': GRAPH, 'ratio': 1e-5}))
+    assert list(data_utils.iter_corpus(str(corpus_file), chunk_size)) == \
+        GRAPH
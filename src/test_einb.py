@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+
+import einb
+
+
+SENTENCES = [
+    'survey data on household income',
+    'panel study of income dynamics data',
+    'unlabelled text about weather stations',
+    'household survey of rural income',
+    'census microdata on employment',
+]
+LABELS = [['HIS'], ['PSID', 'HIS'], [], ['HIS'], ['CENSUS']]
+QUERIES = [
+    'household income survey',
+    'weather stations',
+    'employment census data',
+    'nothing known here',
+]
+
+
+def _assert_same_predictions(dict_preds, sparse_preds):
+    assert [d for d, _ in dict_preds] == [d for d, _ in sparse_preds]
+    scores = [s for _, s in sparse_preds]
+    assert np.all(np.isfinite(scores))
+    assert np.allclose([s for _, s in dict_preds], scores)
+
+
+@pytest.mark.parametrize('labels', [
+    LABELS,
+    # a single dataset
+    [['HIS'] if labels else [] for labels in LABELS],
+])
+def test_dict_and_sparse_predict_agree_with_unlabelled_pub(labels):
+    dataset_word_dict, word_dataset_dict = \
+        einb.parameter_learn(SENTENCES, labels)
+    model = einb.sparse_parameter_learn(SENTENCES, labels)
+    assert 'weather' not in model.word_idx
+    batch = einb.predict_batch(QUERIES, model, 3)
+    for query, batch_preds in zip(QUERIES, batch):
+        dict_preds = einb.predict(query, dataset_word_dict,
+                                  word_dataset_dict, 3)
+        _assert_same_predictions(dict_preds,
+                                 einb.sparse_predict(query, model, 3))
+        _assert_same_predictions(dict_preds, batch_preds)
+
+
+def test_save_model_keeps_loaded_model_intact(tmp_path):
+    model = einb.sparse_parameter_learn(SENTENCES, LABELS)
+    einb.save_model(model, str(tmp_path))
+    loaded = einb.load_model(str(tmp_path))
+    expected = [einb.sparse_predict(q, loaded) for q in QUERIES]
+
+    # overwrite the folder with a model of another shape
+    bigger = einb.sparse_parameter_learn(
+        SENTENCES + ['new words for a new dataset'], LABELS + [['NEW']])
+    einb.save_model(bigger, str(tmp_path))
+    assert [einb.sparse_predict(q, loaded) for q in QUERIES] == expected
+    assert einb.predict_batch(QUERIES, loaded) == expected
+    assert einb.load_model(str(tmp_path)).datasets == bigger.datasets
+    assert not [f for f in tmp_path.iterdir() if f.suffix == '.part']
+
+
+def _assert_same_model(model, expected):
+    assert model.datasets == expected.datasets
+    assert model.words == expected.words
+    for name in ('counts', 'log_counts', 'log_counts_csc'):
+        matrix = getattr(model, name)
+        assert matrix.shape == getattr(expected, name).shape
+        assert np.allclose(matrix.toarray(), getattr(expected, name).toarray())
+    for name in ('u_count', 'count', 'log_idf', 'log_denom'):
+        assert np.allclose(getattr(model, name), getattr(expected, name))
+
+
+@pytest.mark.parametrize('split', [1, 2, 3])
+@pytest.mark.parametrize('new_labels', [
+    # the datasets of the first publications only
+    [['HIS'], ['HIS', 'PSID'], [], ['PSID']],
+    # new datasets, and publications without labels
+    [[], ['NEW'], ['HIS', 'OTHER'], []],
+])
+def test_update_equals_learning_from_scratch(split, new_labels):
+    new_sentences = [
+        'household survey data on new words',
+        'unlabelled weather stations again',
+        'income dynamics of the census',
+        'survey of employment',
+    ]
+    sentences = SENTENCES[:split] + new_sentences
+    labels = LABELS[:split] + new_labels
+    updated = einb.update(
+        einb.sparse_parameter_learn(SENTENCES[:split], LABELS[:split]),
+        new_sentences, new_labels)
+    expected = einb.sparse_parameter_learn(sentences, labels)
+    _assert_same_model(updated, expected)
+    assert einb.predict_batch(QUERIES, updated, 3) == \
+        einb.predict_batch(QUERIES, expected, 3)
+
+
+def test_subtract_counts_of_unknown_dataset():
+    counts = einb.count_learn(['a b'], [['D']])
+    expected = counts.to_tables()
+    # an empty row subtracts nothing
+    assert (counts - einb.NBCounts({'E': {}})).to_tables() == expected
+    with pytest.raises(ValueError):
+        counts - einb.count_learn(['a'], [['E']])
+    assert counts.to_tables() == expected
+
+
+def test_failed_save_model_leaves_no_part_file(tmp_path, monkeypatch):
+    model = einb.sparse_parameter_learn(SENTENCES, LABELS)
+
+    def failing_save(f, array):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(einb.np, 'save', failing_save)
+    with pytest.raises(OSError):
+        einb.save_model(model, str(tmp_path))
+    assert not [f for f in tmp_path.iterdir() if f.suffix == '.part']
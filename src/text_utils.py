@@ -0,0 +1,82 @@
+import mmap
+import os
+
+import nltk
+
+from typing import Iterator
+
+
+STREAM_CHUNK_SIZE = 1 << 20  # characters tokenized at once by iter_sentences
+
+_PUNKT = None
+
+
+def punkt_tokenizer():
+    """ The english punkt sentence tokenizer used by `nltk.sent_tokenize`,
+        loaded once per process.
+    """
+    global _PUNKT
+    if _PUNKT is None:
+        try:
+            from nltk.tokenize import PunktTokenizer
+            _PUNKT = PunktTokenizer('english')
+        except ImportError:
+            # nltk < 3.8.2
+            _PUNKT = nltk.data.load('tokenizers/punkt/english.pickle')
+    return _PUNKT
+
+
+def _join_lines(text: str) -> str:
+    if text.endswith('\n'):
+        text = text[:-1]
+    return text.replace('\n', ' ')
+
+
+def read_text(filename: str, use_mmap: bool = False) -> str:
+    """ Read a text file as a single line: lines are stripped of their
+        newline and joined with a space.
+        With `use_mmap`, the file is memory-mapped and decoded in one go
+        instead of going through a read buffer.
+    """
+    if not use_mmap:
+        with open(filename, 'r', encoding='utf-8') as f:
+            return _join_lines(f.read())
+
+    if os.path.getsize(filename) == 0:
+        return ''
+    with open(filename, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            text = str(data, 'utf-8')
+    # same newline translation as files opened in text mode
+    return _join_lines(text.replace('\r\n', '\n').replace('\r', '\n'))
+
+
+def iter_sentences(filename: str,
+                   chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[str]:
+    """ Yield the sentences (`nltk.sent_tokenize`) of the text returned by
+        `read_text`, reading about `chunk_size` characters at a time.
+        The last sentence of every chunk may be incomplete; it is carried
+        over and tokenized again with the next chunk.
+    """
+    tokenizer = punkt_tokenizer()
+    buffer = None
+    with open(filename, 'r', encoding='utf-8') as f:
+        lines = []
+        size = 0
+        for line in f:
+            lines.append(line.rstrip('\n'))
+            size += len(line)
+            if size < chunk_size:
+                continue
+            buffer = ' '.join(lines if buffer is None else [buffer] + lines)
+            lines = []
+            size = 0
+            spans = list(tokenizer.span_tokenize(buffer))
+            for start, end in spans[:-1]:
+                yield buffer[start:end]
+            if spans:
+                buffer = buffer[spans[-1][0]:]
+        if lines:
+            buffer = ' '.join(lines if buffer is None else [buffer] + lines)
+    for sentence in tokenizer.tokenize(buffer or ''):
+        yield sentence